@@ -1,47 +1,246 @@
+import re
+from collections import defaultdict
+
 from django.contrib import admin
+from django.db import transaction
 from django.urls import reverse
 from django.utils.html import format_html
 from .models import *
+from .pagination import EstimatedCountPaginator
+from . import db, jobs, tasks
+
+# !!!IMPORTANT NOTE!!!: search_fields on related objects (like SectionAdmin's) make search queries PERFORM JOINS.
+# Registrations are searched by their own indexed copies of the section code instead, see
+# `RegistrationAdmin.get_search_results`. Keep it that way for big tables.
+
+# section codes like `CIS-120-001`, `cis 120` or `CIS120001 2019A`, optionally followed by a semester
+SECTION_SEARCH_RE = re.compile(r'^([a-z]{2,4})[\s-]*(\d{3})[\s-]*(\d{3})?(?:\s+(\d{4}[abc]))?$', re.IGNORECASE)
+PHONE_SEARCH_RE = re.compile(r'^\+?[\d\s().-]{3,}$')
+
+
+class ReplicaAdmin(admin.ModelAdmin):
+    """
+    Reads changelists from the read replica, if there is one. Changes made through the admin pin it to
+    the primary for a little while, so they show up in the changelist right away.
+
+    Changelists of big tables use estimated counts and seek deep pages, see `EstimatedCountPaginator`,
+    and filtered lists don't count the whole table on top of the filtered results.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def changelist_view(self, request, extra_context=None):
+        if request.method == 'POST':  # actions
+            return db.pin_client(super().changelist_view(request, extra_context))
+        with db.replica():
+            response = super().changelist_view(request, extra_context)
+            # the results are only queried when the template is rendered
+            if hasattr(response, 'render'):
+                response.render()
+        return response
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        response = super().changeform_view(request, object_id, form_url, extra_context)
+        return db.pin_client(response) if request.method == 'POST' else response
+
+    def delete_view(self, request, object_id, extra_context=None):
+        response = super().delete_view(request, object_id, extra_context)
+        return db.pin_client(response) if request.method == 'POST' else response
+
+
+def enqueue_by_section(task, label, registrations, release=None):
+    """
+    Queue `task` once per section for the registrations in it, all reporting to one admin job.
+    :param registrations: list of (registration id, section id).
+    :param release: called with the ids of the registrations which weren't queued if queueing fails.
+    :return: the number of tasks queued.
+    """
+    by_section = defaultdict(list)
+    for reg_id, section_id in registrations:
+        by_section[section_id].append(reg_id)
+    if len(by_section) > 0:
+        job_id = jobs.start(label, len(registrations))
+        batches = list(by_section.values())
+        queued = 0
+        try:
+            for reg_ids in batches:
+                task.delay(reg_ids, job_id=job_id)
+                queued += 1
+        except Exception:
+            if release is not None:
+                release([reg_id for reg_ids in batches[queued:] for reg_id in reg_ids])
+            raise
+    return len(by_section)
+
+
+def send_alerts_action(registrations_to_alert):
+    """
+    Admin action sending the alerts of the registrations waiting on one among the selected objects.
+    :param registrations_to_alert: function from the selected queryset to those registrations.
+    """
+    def send_alerts(modeladmin, request, queryset):
+        claimed = claim_registrations(list(registrations_to_alert(queryset).values_list('id', flat=True)), 'ADM')
+        registrations = list(Registration.objects.filter(id__in=claimed).values_list('id', 'section_id'))
+        count = enqueue_by_section(tasks.send_section_alerts, 'Send alerts', registrations,
+                                   release=release_registrations)
+        modeladmin.message_user(request, 'Sending %d alerts in %d tasks.' % (len(registrations), count))
+    send_alerts.short_description = 'Send alerts for selected'
+    return send_alerts
+
+
+def resubscribe_action(registrations_to_resubscribe):
+    """
+    Admin action resubscribing registrations among the selected objects.
+    :param registrations_to_resubscribe: function from the selected queryset to those registrations.
+    """
+    def resubscribe(modeladmin, request, queryset):
+        registrations = list(registrations_to_resubscribe(queryset).values_list('id', 'section_id'))
+        count = enqueue_by_section(tasks.resubscribe_registrations, 'Resubscribe', registrations)
+        modeladmin.message_user(request, 'Resubscribing %d registrations in %d tasks.' % (len(registrations), count))
+    resubscribe.short_description = 'Resubscribe selected'
+    return resubscribe
+
 
-# !!!IMPORTANT NOTE!!!: search_fields contains fields on related objects. This means search queries WILL PERFORM JOINS.
-# If this gets too slow, REMOVE THE RELATED FIELDS FROM `search_fields`.
+class BulkActionsAdmin(ReplicaAdmin):
+    """
+    Admin actions which fan out into batched tasks instead of doing the work in the request.
+    Subclasses make their `send_alerts` and `resubscribe` actions with `send_alerts_action` and
+    `resubscribe_action`. The progress of recent actions is shown above the changelist, see `pca.jobs`.
+    """
+    change_list_template = 'admin/pca/jobs_change_list.html'
+    actions = ('send_alerts', 'resubscribe')
 
+    def changelist_view(self, request, extra_context=None):
+        extra_context = extra_context or {}
+        extra_context['admin_jobs'] = jobs.recent()
+        return super().changelist_view(request, extra_context)
 
-class RegistrationAdmin(admin.ModelAdmin):
+
+class RegistrationAdmin(BulkActionsAdmin):
     readonly_fields = ('section_link', 'resubscribed_from', 'created_at')
-    search_fields = ('email', 'phone', 'section__course__department', 'section__course__code', 'section__code')
+    search_fields = ('email', 'phone', 'section_code')
     autocomplete_fields = ('section', )
+    list_select_related = ('section__course', )
+
+    send_alerts = send_alerts_action(lambda queryset: queryset.filter(notification_sent=False))
+    resubscribe = resubscribe_action(lambda queryset: queryset)
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Indexed lookups instead of `search_fields`' LIKE '%...%' over every field: section codes are matched
+        against the search key (exactly, or by prefix for a whole course), phone numbers by prefix of the
+        normalized number, and anything else by email prefix.
+        """
+        term = search_term.strip()
+        if len(term) == 0:
+            return queryset, False
+
+        match = SECTION_SEARCH_RE.match(term)
+        if match is not None:
+            dept_code, course_id, section_id, semester = match.groups()
+            if section_id is not None:
+                query = Q(section_code='%s-%s-%s' % (dept_code.upper(), course_id, section_id))
+            else:
+                query = Q(section_code__startswith='%s-%s-' % (dept_code.upper(), course_id))
+            if semester is not None:
+                query &= Q(semester=semester.upper())
+            return queryset.filter(query), False
+
+        if PHONE_SEARCH_RE.match(term):
+            digits = re.sub(r'\D', '', term)
+            if not term.startswith('+') and not digits.startswith('1'):
+                digits = '1' + digits  # numbers are stored in E.164, and almost all of them are American
+            return queryset.filter(phone__startswith='+' + digits), False
+
+        return queryset.filter(email__istartswith=term), False
+
+    def save_model(self, request, obj, form, change):
+        """Keep the sections' pending counters right when a registration is marked sent or moved in the admin."""
+        if not change:
+            return super().save_model(request, obj, form, change)
+        with transaction.atomic():
+            section_id, notification_sent = Registration.objects.select_for_update() \
+                .values_list('section_id', 'notification_sent').get(id=obj.id)
+            super().save_model(request, obj, form, change)
+            if (section_id, notification_sent) == (obj.section_id, obj.notification_sent):
+                return
+            if not notification_sent:
+                adjust_pending_count(section_id, -1)
+            if not obj.notification_sent:
+                adjust_pending_count(obj.section_id, 1)
 
     def section_link(self, instance):
         link = reverse('admin:pca_section_change', args=[instance.section.id])
         return format_html('<a href="{}">{}</a>', link, instance.section.__str__())
 
 
-class CourseAdmin(admin.ModelAdmin):
+class DeliveryAdmin(ReplicaAdmin):
+    list_display = ('registration', 'channel', 'status', 'attempts', 'updated_at')
+    list_select_related = ('registration__section__course', )
+    list_filter = ('status', 'channel')
+    readonly_fields = ('registration', 'channel', 'attempts', 'last_error', 'created_at', 'updated_at')
+
+
+class CourseAdmin(ReplicaAdmin):
     search_fields = ('department', 'code', 'semester')
 
 
-class SectionAdmin(admin.ModelAdmin):
+class SectionAdmin(BulkActionsAdmin):
     search_fields = ('course__department', 'course__code', 'code', 'course__semester')
-    readonly_fields = ('course_link',)
+    readonly_fields = ('course_link', 'pending_registrations', 'demand')
     autocomplete_fields = ('instructors', 'course')
+    list_select_related = ('course', )
+    actions = BulkActionsAdmin.actions + ('reload_from_registrar', )
+
+    send_alerts = send_alerts_action(
+        lambda queryset: Registration.objects.filter(section__in=queryset, notification_sent=False))
+    # the end of each resubscription chain whose alert has gone out
+    resubscribe = resubscribe_action(
+        lambda queryset: Registration.objects.filter(section__in=queryset, notification_sent=True,
+                                                     resubscribed_to__isnull=True))
+
+    def reload_from_registrar(self, request, queryset):
+        courses = defaultdict(list)
+        for dept_code, course_id, semester, section_id in queryset.values_list(
+                'course__department', 'course__code', 'course__semester', 'code'):
+            courses[('%s-%s' % (dept_code, course_id), semester)].append(section_id)
+        total = sum(len(codes) for codes in courses.values())
+        job_id = jobs.start('Reload from registrar', total)
+        tasks.reload_sections.delay([(course, semester, codes) for (course, semester), codes in courses.items()],
+                                    job_id=job_id)
+        self.message_user(request, 'Reloading %d sections of %d courses.' % (total, len(courses)))
+    reload_from_registrar.short_description = 'Reload selected from registrar'
 
     def course_link(self, instance):
         link = reverse('admin:pca_course_change', args=[instance.course.id])
         return format_html('<a href="{}">{}</a>', link, instance.course.__str__())
 
 
-class InstructorAdmin(admin.ModelAdmin):
+class InstructorAdmin(ReplicaAdmin):
     search_fields = ('name', )
 
 
-class CourseUpdateAdmin(admin.ModelAdmin):
+class CourseUpdateAdmin(ReplicaAdmin):
     autocomplete_fields = ('section', )
     readonly_fields = ('created_at', )
+    list_select_related = ('section__course', )
+
+
+class ArchivedCourseUpdateAdmin(ReplicaAdmin):
+    search_fields = ('section_code', 'semester')
+    readonly_fields = ('body', )
+    exclude = ('request_body', )
+
+
+class ArchivedRegistrationAdmin(ReplicaAdmin):
+    search_fields = ('email', 'phone', 'section_code', 'semester')
 
 
 admin.site.register(Instructor, InstructorAdmin)
 admin.site.register(Course, CourseAdmin)
 admin.site.register(Section, SectionAdmin)
 admin.site.register(Registration, RegistrationAdmin)
+admin.site.register(Delivery, DeliveryAdmin)
 admin.site.register(CourseUpdate, CourseUpdateAdmin)
+admin.site.register(ArchivedCourseUpdate, ArchivedCourseUpdateAdmin)
+admin.site.register(ArchivedRegistration, ArchivedRegistrationAdmin)
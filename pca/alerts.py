@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from smtplib import SMTP, SMTPRecipientsRefused
+from smtplib import SMTP, SMTPException, SMTPRecipientsRefused, SMTPResponseException
 from email.mime.text import MIMEText
 import logging
 
@@ -12,11 +12,27 @@ from twilio.base.exceptions import TwilioRestException
 logger = logging.getLogger(__name__)
 
 
-def send_email(from_, to, subject, html):
+class DeliveryError(Exception):
+    """A failed send. Transient failures, like a throttled or unreachable provider, are worth retrying."""
+    def __init__(self, message, transient=False):
+        super().__init__(message)
+        self.transient = transient
+
+
+EMAIL_FROM = 'Penn Course Alert <team@penncoursealert.com>'
+EMAIL_SUBJECT = '%s is now open!'
+
+
+def email_message(from_, to, subject, html):
     msg = MIMEText(html, 'html')
     msg['Subject'] = subject
     msg['From'] = from_
     msg['To'] = to
+    return msg
+
+
+def send_email(from_, to, subject, html):
+    msg = email_message(from_, to, subject, html)
 
     with SMTP(settings.SMTP_HOST, settings.SMTP_PORT) as server:
         server.ehlo()
@@ -50,13 +66,19 @@ class Email(Alert):
         if self.registration.email is None:
             return False
         try:
-            return send_email(from_='Penn Course Alert <team@penncoursealert.com>',
+            return send_email(from_=EMAIL_FROM,
                               to=self.registration.email,
-                              subject='%s is now open!' % self.registration.section.normalized,
+                              subject=EMAIL_SUBJECT % self.registration.section.normalized,
                               html=self.text)
-        except SMTPRecipientsRefused:
+        except SMTPRecipientsRefused as e:
             logger.exception('Email Error')
-            return False
+            raise DeliveryError('recipient refused: %s' % e.recipients)
+        except SMTPResponseException as e:
+            logger.exception('Email Error')
+            raise DeliveryError('SMTP %d %s' % (e.smtp_code, e.smtp_error), transient=400 <= e.smtp_code < 500)
+        except (SMTPException, OSError) as e:
+            logger.exception('Email Error')
+            raise DeliveryError(repr(e), transient=True)
 
 
 class Text(Alert):
@@ -76,6 +98,9 @@ class Text(Alert):
             )
             if msg.sid is not None:
                 return True
-        except TwilioRestException:
+        except TwilioRestException as e:
             logger.exception('Text Error')
-            return False
+            raise DeliveryError('Twilio %d %s' % (e.status, e.msg), transient=e.status == 429 or e.status >= 500)
+        except OSError as e:
+            logger.exception('Text Error')
+            raise DeliveryError(repr(e), transient=True)
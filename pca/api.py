@@ -3,21 +3,75 @@ import logging
 import json
 
 from django.conf import settings
+
+from .ratelimit import get_bucket, RateLimitExceeded
+from .credentials import pool, bucket_name, masked, NoCredentialAvailable
+
 logger = logging.getLogger(__name__)
 
 
-def get_headers(primary=True):
-    """This will have a rotation of API keys eventually"""
+def get_headers(credential=None):
+    """Headers authenticating with `credential`, or the first key in the pool."""
+    if credential is None:
+        credential = pool.credentials[0]
     return {
         'Content-Type': 'application/json; charset=utf-8',
-        'Authorization-Bearer': settings.API_KEY if primary else settings.API_KEY_SECONDARY,
-        'Authorization-Token': settings.API_SECRET if primary else settings.API_SECRET_SECONDARY
+        'Authorization-Bearer': credential.key,
+        'Authorization-Token': credential.secret
     }
 
 
-def make_api_request(params, headers):
+def throttle(headers):
+    """
+    Wait for the rate limit budget of the credentials in `headers`. The budget is shared by
+    every worker through redis, so the registrar's limit holds no matter how many workers we run.
+    """
+    get_bucket(headers['Authorization-Bearer'] or 'default').acquire()
+
+
+def pooled_request(url, params=None):
+    """
+    GET `url` with the least loaded key in the credential pool. Keys which get rate limited
+    or rejected by the API are benched and the request is retried with the next one.
+    :return: the response, or None and an error message if no key could make the request.
+    """
+    tried = []
+    while len(tried) < len(pool):
+        try:
+            credential = pool.select(exclude=tried)
+            get_bucket(bucket_name(credential)).acquire()
+        except (NoCredentialAvailable, RateLimitExceeded) as e:
+            return None, str(e)
+        tried.append(credential)
+
+        pool.record(credential, 'requests')
+        r = requests.get(url, params=params, headers=get_headers(credential))
+        if r.status_code == requests.codes.ok:
+            pool.record(credential, 'ok')
+            return r, None
+        elif r.status_code == requests.codes.too_many_requests:
+            pool.record(credential, 'throttled')
+            pool.cooldown(credential, settings.API_KEY_COOLDOWN, 'throttled')
+        elif r.status_code == requests.codes.unauthorized:
+            pool.record(credential, 'unauthorized')
+            pool.cooldown(credential, settings.API_KEY_UNAUTHORIZED_COOLDOWN, 'unauthorized')
+        else:
+            pool.record(credential, 'errors')
+            return None, r.text
+        logger.info('Penn API key %s failed with %d, trying the next one', masked(credential), r.status_code)
+
+    return None, 'every Penn API key was throttled or rejected'
+
+
+def make_api_request(params, headers=None):
     if headers is None:
-        headers = get_headers()
+        r, err = pooled_request(settings.API_URL, params)
+        return (r.json(), None) if r is not None else (None, err)
+
+    try:
+        throttle(headers)
+    except RateLimitExceeded as e:
+        return None, str(e)
 
     r = requests.get(settings.API_URL,
                      params=params,
@@ -38,19 +92,16 @@ def report_api_error(err):
 
 
 def get_all_course_availability(semester):
-    headers = get_headers()
     url = f'https://esb.isc-seo.upenn.edu/8091/open_data/course_status/{semester}/all'
-    r = requests.get(url, headers=headers)
-    if r.status_code == requests.codes.ok:
+    r, err = pooled_request(url)
+    if r is not None:
         return r.json().get('result_data', [])
     else:
-        report_api_error(r.text)
+        report_api_error(err)
         return None
 
 
 def get_courses(query, semester):
-    headers = get_headers()
-
     params = {
         'course_id': query,
         'term': semester,
@@ -61,7 +112,7 @@ def get_courses(query, semester):
     results = []
     while True:
         logger.info('making request for page #%d' % params['page_number'])
-        data, err = make_api_request(params, headers)
+        data, err = make_api_request(params)
         if data is not None:
             next_page = data['service_meta']['next_page_number']
             results.extend(data['result_data'])
@@ -80,13 +131,12 @@ def first(lst):
         return lst[0]
 
 
-def get_course(query, semester, primary=True):
+def get_course(query, semester):
     params = {
         'course_id': query,
         'term': semester
     }
-    headers = get_headers(primary)
-    data, err = make_api_request(params, headers)
+    data, err = make_api_request(params)
     if err is None and data is not None:
         return first(data['result_data'])
     else:
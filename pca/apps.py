@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class PcaConfig(AppConfig):
     name = 'pca'
+
+    def ready(self):
+        from . import audit, db  # noqa: F401
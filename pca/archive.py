@@ -0,0 +1,108 @@
+import zlib
+import logging
+
+from django.db import transaction
+
+from .models import (Course, Section, Registration, CourseUpdate, ArchivedCourseUpdate, ArchivedRegistration,
+                     get_current_semester)
+
+logger = logging.getLogger(__name__)
+
+
+def compress(text):
+    return zlib.compress(text.encode(), 9)
+
+
+def chunks(queryset, batch_size, order='id'):
+    """
+    Ids of `queryset` a batch at a time. The ids are re-queried for each batch since the
+    previous one was deleted, so each batch is a short query from the start of the index.
+    """
+    while True:
+        ids = list(queryset.order_by(order).values_list('id', flat=True)[:batch_size])
+        if len(ids) == 0:
+            return
+        yield ids
+
+
+def archive_course_updates(semester, batch_size):
+    archived = 0
+    for ids in chunks(CourseUpdate.objects.filter(section__course__semester=semester), batch_size):
+        updates = CourseUpdate.objects.filter(id__in=ids).values_list(
+            'section__course__department', 'section__course__code', 'section__code',
+            'old_status', 'new_status', 'created_at', 'alert_sent', 'request_body')
+        with transaction.atomic():
+            ArchivedCourseUpdate.objects.bulk_create([
+                ArchivedCourseUpdate(semester=semester,
+                                     section_code='%s-%s-%s' % (dept, course, section),
+                                     old_status=old_status,
+                                     new_status=new_status,
+                                     created_at=created_at,
+                                     alert_sent=alert_sent,
+                                     request_body=compress(request_body))
+                for dept, course, section, old_status, new_status, created_at, alert_sent, request_body in updates
+            ])
+            CourseUpdate.objects.filter(id__in=ids).delete()
+        archived += len(ids)
+        logger.info('archived %d course updates from %s', archived, semester)
+    return archived
+
+
+def archive_registrations(semester, batch_size):
+    archived = 0
+    # newest first, so resubscriptions are archived before the registrations they point back to
+    for ids in chunks(Registration.objects.filter(section__course__semester=semester), batch_size, '-id'):
+        regs = Registration.objects.filter(id__in=ids).values_list(
+            'id', 'resubscribed_from_id', 'section__course__department', 'section__course__code', 'section__code',
+            'created_at', 'email', 'phone', 'notification_sent', 'notification_sent_at', 'notification_sent_by')
+        with transaction.atomic():
+            ArchivedRegistration.objects.bulk_create([
+                ArchivedRegistration(semester=semester,
+                                     section_code='%s-%s-%s' % (dept, course, section),
+                                     original_id=id_,
+                                     resubscribed_from_id=resubscribed_from_id,
+                                     created_at=created_at,
+                                     email=email,
+                                     phone=phone,
+                                     notification_sent=notification_sent,
+                                     notification_sent_at=notification_sent_at,
+                                     notification_sent_by=notification_sent_by)
+                for (id_, resubscribed_from_id, dept, course, section, created_at, email, phone,
+                     notification_sent, notification_sent_at, notification_sent_by) in regs
+            ])
+            Registration.objects.filter(id__in=ids).delete()
+        archived += len(ids)
+        logger.info('archived %d registrations from %s', archived, semester)
+    return archived
+
+
+def drop_catalog(semester, batch_size):
+    """Delete a semester's sections and courses, once nothing references them anymore."""
+    dropped = 0
+    for ids in chunks(Section.objects.filter(course__semester=semester), batch_size):
+        Section.objects.filter(id__in=ids).delete()
+        dropped += len(ids)
+    for ids in chunks(Course.objects.filter(semester=semester), batch_size):
+        Course.objects.filter(id__in=ids).delete()
+    return dropped
+
+
+def archive_semester(semester, batch_size=1000, keep_catalog=False):
+    """
+    Move a past semester's course updates and registrations to the archive tables, compressing the raw
+    webhook payloads, and then drop its courses and sections from the hot tables. Every batch is its own
+    short transaction, so the hot tables are never locked for long.
+    :return: dict of the number of rows archived or dropped per table.
+    """
+    if semester == get_current_semester():
+        raise ValueError('refusing to archive the current semester (%s)' % semester)
+
+    result = {
+        'course_updates': archive_course_updates(semester, batch_size),
+        'registrations': archive_registrations(semester, batch_size),
+    }
+    if keep_catalog:
+        Section.objects.filter(course__semester=semester).update(pending_registrations=0)
+    else:
+        result['sections'] = drop_catalog(semester, batch_size)
+    return result
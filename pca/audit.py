@@ -0,0 +1,21 @@
+import random
+import logging
+
+from celery.signals import task_postrun
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def sampled():
+    return random.random() < settings.TASK_AUDIT_SAMPLE_RATE
+
+
+@task_postrun.connect
+def audit_task(task_id=None, task=None, args=None, kwargs=None, retval=None, state=None, **extra):
+    """
+    Log a TASK_AUDIT_SAMPLE_RATE sample of finished tasks along with their arguments and return values.
+    Most tasks don't store their results anywhere, so this is what there is to look at when debugging them.
+    """
+    if sampled():
+        logger.info('task %s[%s] %s args=%r kwargs=%r result=%r', task.name, task_id, state, args, kwargs, retval)
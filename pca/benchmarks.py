@@ -0,0 +1,257 @@
+"""
+Benchmarks run with `python manage.py benchmark <name>`. Each one returns a list of (label, value) rows.
+They run against the configured database and redis, so point them at a copy of production data.
+"""
+import gzip
+import json
+import time
+import threading
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import transaction
+from django.test.utils import override_settings
+
+from pca import catalog
+from pca.models import Course, Section, Registration, normalize_phone, get_current_semester
+from pca.tasks import build_course_json
+
+
+def timed(fn, repeat):
+    """Best wall clock time of `repeat` calls to `fn`, and its last result."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def size(payload):
+    raw = json.dumps(payload).encode()
+    return '%d bytes (%d gzipped)' % (len(raw), len(gzip.compress(raw)))
+
+
+def catalog_formats(repeat=5, semester=None):
+    """
+    Byte size and build time of the /courses payload, in the original and compact formats.
+    The catalog is built without caching it, so this doesn't replace the cache production serves from.
+    """
+    if semester is None:
+        semester = get_current_semester()
+    build_time, sections = timed(lambda: build_course_json(semester), repeat)
+    compact_time, compact = timed(lambda: catalog.compact(sections), repeat)
+    serialize_time, _ = timed(lambda: json.dumps(sections), repeat)
+    compact_serialize_time, _ = timed(lambda: json.dumps(compact), repeat)
+    return [
+        ('sections', len(sections)),
+        ('original size', size(sections)),
+        ('compact size', size(compact)),
+        ('database build', '%.1f ms' % (build_time * 1000)),
+        ('compact encoding', '%.1f ms' % (compact_time * 1000)),
+        ('original serialization', '%.1f ms' % (serialize_time * 1000)),
+        ('compact serialization', '%.1f ms' % (compact_serialize_time * 1000)),
+    ]
+
+
+def per_second(seconds, n):
+    return '%.0f/s' % (n / seconds)
+
+
+def registration_saves(repeat=5, n=1000):
+    """
+    Registration.save() throughput. Re-saves of unchanged registrations (as in alert() and resubscribe)
+    skip phone normalization, compared here to parsing the number on every save like before.
+    Everything runs in a transaction which is rolled back.
+    """
+    with transaction.atomic():
+        course = Course.objects.create(department='BNCH', code='000', semester='0000Z', title='Benchmark')
+        section = Section.objects.create(course=course, code='000')
+        new_time, _ = timed(lambda: [Registration(section=section, email='bench%d@example.com' % i,
+                                                  phone='215555%04d' % i).save() for i in range(n)], 1)
+        regs = list(Registration.objects.filter(section=section))
+
+        def resave():
+            for reg in regs:
+                reg.save()
+
+        def resave_normalizing():
+            # parsing every time, like before normalize_phone was memoized
+            for reg in regs:
+                reg.phone = normalize_phone.__wrapped__(reg.phone)
+                reg.save()
+
+        resave_time, _ = timed(resave, repeat)
+        normalizing_time, _ = timed(resave_normalizing, repeat)
+        transaction.set_rollback(True)
+
+    phones = ['(215) 555-%04d' % i for i in range(n)]
+    normalize_phone.cache_clear()
+    parse_time, _ = timed(lambda: [normalize_phone(p) for p in phones], 1)
+    cached_time, _ = timed(lambda: [normalize_phone(p) for p in phones], repeat)
+    return [
+        ('new registrations', per_second(new_time, n)),
+        ('re-saves, normalizing', per_second(normalizing_time, n)),
+        ('re-saves, dirty tracking', per_second(resave_time, n)),
+        ('phone parsing', per_second(parse_time, n)),
+        ('phone parsing, memoized', per_second(cached_time, n)),
+    ]
+
+
+def burst_app(routes, latencies, done):
+    """
+    Celery app on an in-memory broker with stand-ins for the alert and polling tasks which just sleep
+    for their `latencies`. Completed alerts are counted in `done`, a dict with a lock and an event.
+    """
+    from celery import Celery
+    import celery.contrib.testing.tasks  # noqa: F401 registers the ping task the test worker checks for
+
+    app = Celery('burst', broker='memory://')
+    app.conf.update(task_routes=routes, task_ignore_result=True,
+                    worker_prefetch_multiplier=settings.CELERY_WORKER_PREFETCH_MULTIPLIER,
+                    broker_transport_options={'polling_interval': 0.01})
+
+    @app.task(name='pca.tasks.send_alerts_for')
+    def send_alerts_for():
+        time.sleep(latencies['poll'])
+
+    @app.task(name='pca.tasks.send_alert', acks_late=True)
+    def send_alert():
+        time.sleep(latencies['alert'])
+        with done['lock']:
+            done['alerts'] += 1
+            if done['alerts'] == done['expected']:
+                done['finished'] = time.perf_counter()
+                done['event'].set()
+
+    return app
+
+
+def drain_time(routes, workers, n_polls, n_alerts, latencies):
+    """
+    Seconds from enqueueing a burst of `n_polls` polls followed by `n_alerts` alerts until the last alert
+    has been sent, with one single-process worker per entry in `workers`, each a list of queues to consume.
+    """
+    from celery.contrib.testing.worker import start_worker
+
+    done = {'lock': threading.Lock(), 'event': threading.Event(), 'alerts': 0, 'expected': n_alerts}
+    with ExitStack() as stack:
+        apps = []
+        for queues in workers:
+            # one app per worker, all sharing the process-wide in-memory broker
+            app = burst_app(routes, latencies, done)
+            stack.enter_context(start_worker(app, perform_ping_check=False, queues=queues))
+            apps.append(app)
+
+        start = time.perf_counter()
+        for _ in range(n_polls):
+            apps[0].send_task('pca.tasks.send_alerts_for')
+        for _ in range(n_alerts):
+            apps[0].send_task('pca.tasks.send_alert')
+        if not done['event'].wait(timeout=n_polls * latencies['poll'] + n_alerts * latencies['alert'] + 60):
+            raise RuntimeError('burst did not drain, %d of %d alerts sent' % (done['alerts'], n_alerts))
+        return done['finished'] - start
+
+
+def alert_burst(repeat=5, n_polls=200, n_alerts=500, poll_latency=0.05, alert_latency=0.005):
+    """
+    Time to drain a burst of alerts which arrives behind a round of polls, on an in-memory broker,
+    with the queue routing from settings compared to the old setup where routes were never applied and
+    every task landed on the default queue. Each worker is a single process, so this models how the
+    topology orders work rather than absolute throughput.
+    """
+    latencies = {'poll': poll_latency, 'alert': alert_latency}
+    workers = [['polls_priority'], ['polls', 'catalog', 'celery'], ['alerts']]
+    rows = [('polls', n_polls), ('alerts', n_alerts)]
+    for label, routes in [('unrouted', {}), ('routed', settings.CELERY_TASK_ROUTES)]:
+        best = min(drain_time(routes, workers, n_polls, n_alerts, latencies) for _ in range(repeat))
+        rows.append(('%s drain time' % label, '%.2f s' % best))
+    return rows
+
+
+def alert_delivery(repeat=5, n=200, latency=0.05):
+    """
+    Time to send `n` alerts, half texts and half emails, through the fake SMTP and Twilio servers taking
+    `latency` seconds per message: one message at a time like the blocking senders in pca/alerts.py,
+    and with the async delivery engine's default concurrency. Rate limits are off.
+    """
+    import asyncio
+    from pca.delivery import DeliveryEngine, Message
+    from pca.fakes import FakeSMTPServer, FakeTwilioServer
+
+    messages = [Message(i, 'text', '+1215555%04d' % i, None, 'open!') if i % 2 == 0 else
+                Message(i, 'email', 'bench%d@example.com' % i, 'open!', 'open!') for i in range(n)]
+
+    async def send_all(concurrency):
+        smtp, twilio = FakeSMTPServer(latency), FakeTwilioServer(latency)
+        await smtp.start()
+        await twilio.start()
+        try:
+            engine = DeliveryEngine(concurrency=concurrency, email_rate=0, text_rate=0, smtp_host='127.0.0.1',
+                                    smtp_port=smtp.port, smtp_starttls=False, twilio_url=twilio.url)
+            start = time.perf_counter()
+            results = await engine.run(messages)
+            elapsed = time.perf_counter() - start
+        finally:
+            await smtp.stop()
+            await twilio.stop()
+        if any(error is not None for _, error, _ in results):
+            raise RuntimeError('not every message was delivered')
+        return elapsed
+
+    sequential = min(asyncio.run(send_all(1)) for _ in range(repeat))
+    concurrent = min(asyncio.run(send_all(settings.DELIVERY_CONCURRENCY)) for _ in range(repeat))
+    return [
+        ('messages', n),
+        ('one at a time', '%.2f s (%s)' % (sequential, per_second(sequential, n))),
+        ('async engine', '%.2f s (%s)' % (concurrent, per_second(concurrent, n))),
+    ]
+
+
+def connection_reuse(repeat=5, n=500):
+    """
+    Throughput of tiny tasks, one indexed query each, closing the database connection after every task
+    like the workers did before, compared to keeping it open with the checks run before every task.
+    """
+    from django.db import connection
+    from pca.db import check_connections
+
+    def task():
+        Section.objects.filter(id=0).exists()
+
+    def closing():
+        for _ in range(n):
+            task()
+            connection.close()
+
+    def persistent():
+        for _ in range(n):
+            check_connections()
+            task()
+
+    closing_time, _ = timed(closing, repeat)
+    max_age = connection.settings_dict['CONN_MAX_AGE']
+    connection.settings_dict['CONN_MAX_AGE'] = None  # persistent whatever DB_CONN_MAX_AGE is set to
+    try:
+        connection.close()
+        with_checks, _ = timed(persistent, repeat)
+        with override_settings(DB_HEALTH_CHECKS=False):
+            without_checks, _ = timed(persistent, repeat)
+    finally:
+        connection.settings_dict['CONN_MAX_AGE'] = max_age
+        connection.close()
+    return [
+        ('database', connection.vendor),
+        ('connection per task', per_second(closing_time, n)),
+        ('persistent, health checks', per_second(with_checks, n)),
+        ('persistent, no health checks', per_second(without_checks, n)),
+    ]
+
+
+BENCHMARKS = {
+    'catalog': catalog_formats,
+    'saves': registration_saves,
+    'burst': alert_burst,
+    'delivery': alert_delivery,
+    'pooling': connection_reuse,
+}
@@ -0,0 +1,78 @@
+COMPACT_CONTENT_TYPE = 'application/vnd.pca.compact+json'
+COMPACT_VERSION = 1
+
+
+class Interner:
+    """Assigns each distinct value an index into a shared table."""
+    def __init__(self):
+        self.table = []
+        self.index = {}
+
+    def __call__(self, value):
+        if value not in self.index:
+            self.index[value] = len(self.table)
+            self.table.append(value)
+        return self.index[value]
+
+
+def compact(sections):
+    """
+    Columnar encoding of the catalog from `generate_course_json`. Course titles are stored once per course,
+    instructor names and meeting strings once overall, and every section field is a parallel array
+    instead of an object repeating its field names:
+
+        {
+            'version': 1,
+            'courses': {'course_id': ['CIS-120', ...], 'title': ['Programming Languages...', ...]},
+            'instructors': ['Stephanie Weirich', ...],
+            'meetings': ['MWF 12:00 PM - 01:00 PM', ...],
+            'sections': {'course': [0, ...], 'code': ['001', ...], 'instructors': [[0], ...],
+                         'meeting_days': [[0], ...]},
+        }
+
+    Fields added to sections by `generate_course_json` beyond those get their own column in `sections`.
+    """
+    courses = Interner()
+    course_titles = []
+    instructors = Interner()
+    meetings = Interner()
+    columns = {'course': [], 'code': [], 'instructors': [], 'meeting_days': []}
+
+    for section in sections:
+        course_id, code = section['section_id'].rsplit('-', 1)
+        course = courses(course_id)
+        if course == len(course_titles):
+            course_titles.append(section['course_title'])
+        columns['course'].append(course)
+        columns['code'].append(code)
+        columns['instructors'].append([instructors(name) for name in section['instructors']])
+        columns['meeting_days'].append([meetings(m) for m in section['meeting_days']])
+        for field, value in section.items():
+            if field not in ('section_id', 'course_title', 'instructors', 'meeting_days'):
+                columns.setdefault(field, []).append(value)
+
+    return {
+        'version': COMPACT_VERSION,
+        'courses': {'course_id': courses.table, 'title': course_titles},
+        'instructors': instructors.table,
+        'meetings': meetings.table,
+        'sections': columns,
+    }
+
+
+def expand(catalog):
+    """Inverse of `compact`. The typeahead does the same thing in `expandCourses` in searchbar.js."""
+    courses, columns = catalog['courses'], catalog['sections']
+    extra = [field for field in columns if field not in ('course', 'code', 'instructors', 'meeting_days')]
+    sections = []
+    for i, course in enumerate(columns['course']):
+        section = {
+            'section_id': '%s-%s' % (courses['course_id'][course], columns['code'][i]),
+            'course_title': courses['title'][course],
+            'instructors': [catalog['instructors'][j] for j in columns['instructors'][i]],
+            'meeting_days': [catalog['meetings'][j] for j in columns['meeting_days'][i]],
+        }
+        for field in extra:
+            section[field] = columns[field][i]
+        sections.append(section)
+    return sections
@@ -0,0 +1,94 @@
+import logging
+from collections import namedtuple
+
+from django.conf import settings
+
+from .ratelimit import r, get_bucket
+
+logger = logging.getLogger(__name__)
+
+Credential = namedtuple('Credential', ['key', 'secret'])
+
+METRIC_FIELDS = ('requests', 'ok', 'errors', 'throttled', 'unauthorized')
+
+
+def cooldown_key(credential):
+    return 'pca:api:cooldown:%s' % credential.key
+
+
+def metrics_key(credential):
+    return 'pca:api:metrics:%s' % credential.key
+
+
+def bucket_name(credential):
+    return credential.key or 'default'
+
+
+def masked(credential):
+    """Identify a key in logs and metrics without printing the whole thing."""
+    return credential.key[:6] + '...' if len(credential.key) > 6 else credential.key
+
+
+class NoCredentialAvailable(Exception):
+    pass
+
+
+class CredentialPool:
+    """
+    Rotation of Penn API credentials. Every key has its own rate limit budget, so requests are
+    spread over the key with the most budget left, and keys the API rejects are benched for a while.
+    """
+    def __init__(self, credentials):
+        self.credentials = [Credential(*c) for c in credentials]
+
+    def __len__(self):
+        return len(self.credentials)
+
+    def select(self, exclude=()):
+        """Least loaded credential which isn't cooling down, fetched in a single redis round trip."""
+        candidates = [c for c in self.credentials if c not in exclude]
+        pipe = r.pipeline(transaction=False)
+        pipe.time()
+        for c in candidates:
+            pipe.exists(cooldown_key(c))
+            pipe.hmget(get_bucket(bucket_name(c)).key, 'tokens', 'ts')
+        now, *state = pipe.execute()
+
+        best, best_tokens = None, -1
+        for i, c in enumerate(candidates):
+            cooling, bucket = state[2 * i], state[2 * i + 1]
+            if cooling:
+                continue
+            tokens = get_bucket(bucket_name(c)).peek(bucket, now)
+            if tokens > best_tokens:
+                best, best_tokens = c, tokens
+
+        if best is None:
+            raise NoCredentialAvailable('all %d Penn API keys are cooling down' % len(candidates))
+        return best
+
+    def cooldown(self, credential, seconds, reason):
+        logger.warning('benching Penn API key %s for %ds (%s)', masked(credential), seconds, reason)
+        r.set(cooldown_key(credential), reason, ex=seconds)
+
+    def record(self, credential, field):
+        r.hincrby(metrics_key(credential), field, 1)
+
+    def metrics(self):
+        """Request counts and cooldown status for every key in the pool."""
+        pipe = r.pipeline(transaction=False)
+        for c in self.credentials:
+            pipe.hgetall(metrics_key(c))
+            pipe.ttl(cooldown_key(c))
+        state = pipe.execute()
+
+        result = {}
+        for i, c in enumerate(self.credentials):
+            counts, ttl = state[2 * i], state[2 * i + 1]
+            metrics = {field: int(counts.get(field.encode(), 0)) for field in METRIC_FIELDS}
+            metrics['cooldown'] = max(ttl or 0, 0)
+            result[masked(c)] = metrics
+        return result
+
+
+pool = CredentialPool(settings.API_CREDENTIALS)
@@ -0,0 +1,128 @@
+import logging
+from functools import wraps
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from celery.signals import task_prerun, worker_process_init
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connections, close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+def check_connections():
+    """
+    Close connections which are older than DB_CONN_MAX_AGE or broken, and with DB_HEALTH_CHECKS on, ping the
+    rest, so one the server dropped while idle (like after MySQL's wait_timeout) is replaced before it's used
+    rather than failing the first query.
+    """
+    close_old_connections()
+    if settings.DB_HEALTH_CHECKS:
+        for conn in connections.all():
+            if conn.connection is not None and not conn.is_usable():
+                logger.info('closing unusable connection to %s', conn.alias)
+                conn.close()
+
+
+@request_started.connect
+def check_request_connections(**kwargs):
+    # Django only closes old connections at the start of a request, without a health check
+    if settings.DB_HEALTH_CHECKS:
+        check_connections()
+
+
+@task_prerun.connect
+def check_task_connections(**kwargs):
+    # celery sends no request signals, so without this, workers would never recycle their connections
+    check_connections()
+
+
+@worker_process_init.connect
+def discard_inherited_connections(**kwargs):
+    """
+    Forked worker processes share the sockets of any connection the parent had open. Closing one properly
+    would close it for the parent too, so the child just forgets about them and connects on its own.
+    """
+    for conn in connections.all():
+        conn.connection = None
+
+
+# Read replica routing. Reads inside a `replica()` block go to the REPLICA database if one is configured,
+# until something is written in the block, after which they go to the primary so the write is visible.
+# `primary()` sends reads to the primary regardless. Writes always go to the primary.
+
+REPLICA = 'replica'
+PIN_COOKIE = 'pca_primary'
+
+_replica = ContextVar('pca_replica', default=False)
+_pinned = ContextVar('pca_pinned', default=False)
+
+
+@contextmanager
+def replica():
+    replica_token = _replica.set(True)
+    # a write in the block only pins the reads in the block
+    pinned_token = _pinned.set(_pinned.get())
+    try:
+        yield
+    finally:
+        _pinned.reset(pinned_token)
+        _replica.reset(replica_token)
+
+
+@contextmanager
+def primary():
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+def reading_from_replica():
+    return REPLICA in settings.DATABASES and _replica.get() and not _pinned.get()
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return REPLICA if reading_from_replica() else 'default'
+
+    def db_for_write(self, model, **hints):
+        if _replica.get():
+            _pinned.set(True)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+def pin_client(response):
+    """Keep the client reading from the primary for REPLICA_PIN_SECONDS, so it sees what it just wrote."""
+    response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True)
+    return response
+
+
+def pins_primary(view):
+    """Decorator for views which write. They read from the primary, and so do the client's next requests."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with primary():
+            response = view(request, *args, **kwargs)
+        return pin_client(response)
+    return wrapper
+
+
+class PrimaryPinMiddleware:
+    """Serves requests of clients pinned by `pin_client` from the primary only."""
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if PIN_COOKIE in request.COOKIES:
+            with primary():
+                return self.get_response(request)
+        return self.get_response(request)
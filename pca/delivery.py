@@ -0,0 +1,134 @@
+"""
+Asyncio delivery engine. Sends the emails and texts for a batch of alerts concurrently from one process,
+instead of one blocking SMTP or Twilio call at a time. Used by `send_section_alerts` and `retry_deliveries`
+with the ASYNC_DELIVERY option on.
+"""
+import random
+import asyncio
+import logging
+from collections import namedtuple
+
+import aiohttp
+import aiosmtplib
+from django.conf import settings
+
+from .alerts import Email, Text, DeliveryError, EMAIL_FROM, EMAIL_SUBJECT, email_message
+
+logger = logging.getLogger(__name__)
+
+TWILIO_MESSAGES_PATH = '/2010-04-01/Accounts/%s/Messages.json'
+
+# one email or text. `key` identifies what it was sent for, like a Delivery id.
+Message = namedtuple('Message', ['key', 'channel', 'to', 'subject', 'body'])
+
+
+def delivery_message(delivery):
+    """The message for a Delivery of an alert, rendered for its registration."""
+    reg = delivery.registration
+    if delivery.channel == 'text':
+        return Message(delivery.id, 'text', reg.phone, None, Text(reg).text)
+    return Message(delivery.id, 'email', reg.email, EMAIL_SUBJECT % reg.section.normalized, Email(reg).text)
+
+
+class RateLimiter:
+    """Spaces out callers of `acquire` so at most `rate` get through per second. No limit if `rate` is falsy."""
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_at = 0
+
+    async def acquire(self):
+        if self.interval == 0:
+            return
+        now = asyncio.get_event_loop().time()
+        wait = self.next_at - now
+        self.next_at = max(now, self.next_at) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class DeliveryEngine:
+    """
+    Sends messages with at most `concurrency` in flight, per-channel rate limits (messages per second),
+    and up to `retries` quick in-process retries of transient failures, backing off exponentially with jitter
+    from `backoff` seconds. Messages still failing after that are left to the `retry_deliveries` task.
+    Everything defaults to settings, the provider endpoints included, so tests and benchmarks can point
+    the engine at the servers in `pca.fakes` instead.
+    """
+    def __init__(self, concurrency=None, retries=None, backoff=None, email_rate=None, text_rate=None,
+                 smtp_host=None, smtp_port=None, smtp_starttls=None, twilio_url=None):
+        self.concurrency = concurrency or settings.DELIVERY_CONCURRENCY
+        self.retries = settings.DELIVERY_RETRIES if retries is None else retries
+        self.backoff = settings.DELIVERY_BACKOFF if backoff is None else backoff
+        self.rates = {
+            'email': settings.EMAIL_RATE_LIMIT if email_rate is None else email_rate,
+            'text': settings.TEXT_RATE_LIMIT if text_rate is None else text_rate,
+        }
+        self.smtp_host = smtp_host or settings.SMTP_HOST
+        self.smtp_port = int(smtp_port or settings.SMTP_PORT)
+        self.smtp_starttls = settings.SMTP_STARTTLS if smtp_starttls is None else smtp_starttls
+        self.twilio_url = (twilio_url or settings.TWILIO_API_URL) + TWILIO_MESSAGES_PATH % settings.TWILIO_SID
+
+    async def send_email(self, message):
+        msg = email_message(EMAIL_FROM, message.to, message.subject, message.body)
+        try:
+            await aiosmtplib.send(msg,
+                                  hostname=self.smtp_host,
+                                  port=self.smtp_port,
+                                  username=settings.SMTP_USERNAME or None,
+                                  password=settings.SMTP_PASSWORD or None,
+                                  start_tls=self.smtp_starttls)
+        except aiosmtplib.SMTPRecipientsRefused as e:
+            logger.exception('Email Error')
+            raise DeliveryError('recipient refused: %s' % e.recipients)
+        except aiosmtplib.SMTPResponseException as e:
+            raise DeliveryError('SMTP %d %s' % (e.code, e.message), transient=400 <= e.code < 500)
+        except (aiosmtplib.SMTPException, OSError, asyncio.TimeoutError) as e:
+            raise DeliveryError(repr(e), transient=True)
+
+    async def send_text(self, session, message):
+        data = {'To': message.to, 'From': settings.TWILIO_NUMBER, 'Body': message.body}
+        try:
+            async with session.post(self.twilio_url, data=data) as response:
+                if response.status >= 400:
+                    raise DeliveryError('Twilio %d %s' % (response.status, await response.text()),
+                                        transient=response.status == 429 or response.status >= 500)
+                if (await response.json()).get('sid') is None:
+                    raise DeliveryError('Twilio returned no message sid')
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise DeliveryError(repr(e), transient=True)
+
+    async def deliver(self, session, message):
+        """
+        Send one message, retrying transient failures.
+        :return: the DeliveryError of the last attempt, or None if it was sent, and the number of attempts made.
+        """
+        for attempt in range(1, self.retries + 2):
+            await self.limiters[message.channel].acquire()
+            try:
+                async with self.semaphore:
+                    if message.channel == 'email':
+                        await self.send_email(message)
+                    else:
+                        await self.send_text(session, message)
+                return None, attempt
+            except DeliveryError as e:
+                if not e.transient or attempt > self.retries:
+                    logger.error('%s to %s failed after %d attempts: %s', message.channel, message.to, attempt, e)
+                    return e, attempt
+            # back off outside the semaphore, so waiting retries don't hold up other messages
+            await asyncio.sleep(self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1))
+
+    async def run(self, messages):
+        """:return: list of (message, error, attempts) for each of `messages`, in order. See `deliver`."""
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.limiters = {channel: RateLimiter(rate) for channel, rate in self.rates.items()}
+        auth = aiohttp.BasicAuth(settings.TWILIO_SID, settings.TWILIO_AUTH_TOKEN)
+        async with aiohttp.ClientSession(auth=auth) as session:
+            results = await asyncio.gather(*[self.deliver(session, m) for m in messages])
+        return [(message, error, attempts) for message, (error, attempts) in zip(messages, results)]
+
+    def send(self, messages):
+        """Blocking entry point for celery tasks."""
+        if len(messages) == 0:
+            return []
+        return asyncio.run(self.run(messages))
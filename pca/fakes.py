@@ -0,0 +1,112 @@
+"""
+Local stand-ins for the SMTP server and the Twilio API, for testing and benchmarking `pca.delivery`.
+Both run on the current event loop on a free localhost port:
+
+    smtp, twilio = FakeSMTPServer(), FakeTwilioServer()
+    await smtp.start()
+    await twilio.start()
+    engine = DeliveryEngine(smtp_host='127.0.0.1', smtp_port=smtp.port, smtp_starttls=False, twilio_url=twilio.url)
+"""
+import socket
+import asyncio
+
+from aiohttp import web
+
+
+class FakeSMTPServer:
+    """
+    Just enough SMTP for aiosmtplib to send through, without TLS or authentication.
+    Takes `latency` seconds to accept each message, answers the first `fail_first` with a 421 (try again later),
+    and refuses recipients in `refuse`.
+    """
+    def __init__(self, latency=0, fail_first=0, refuse=()):
+        self.latency = latency
+        self.failures_left = fail_first
+        self.refuse = set(refuse)
+        self.messages = []
+
+    async def handle(self, reader, writer):
+        writer.write(b'220 fake ESMTP\r\n')
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            command = line.decode().strip()
+            verb = command.split(' ', 1)[0].upper()
+            if verb == 'EHLO':
+                writer.write(b'250-fake\r\n250 8BITMIME\r\n')
+            elif verb == 'HELO':
+                writer.write(b'250 fake\r\n')
+            elif verb == 'MAIL' and self.failures_left > 0:
+                self.failures_left -= 1
+                writer.write(b'421 try again later\r\n')
+                await writer.drain()
+                break
+            elif verb == 'RCPT' and any(address in command for address in self.refuse):
+                writer.write(b'550 no such user\r\n')
+            elif verb == 'DATA':
+                writer.write(b'354 go ahead\r\n')
+                await writer.drain()
+                data = []
+                while True:
+                    line = await reader.readline()
+                    if line in (b'.\r\n', b''):
+                        break
+                    data.append(line)
+                await asyncio.sleep(self.latency)
+                self.messages.append(b''.join(data))
+                writer.write(b'250 queued\r\n')
+            elif verb == 'QUIT':
+                writer.write(b'221 bye\r\n')
+                await writer.drain()
+                break
+            elif verb in ('MAIL', 'RCPT', 'RSET', 'NOOP'):
+                writer.write(b'250 ok\r\n')
+            else:
+                writer.write(b'502 not implemented\r\n')
+            await writer.drain()
+        writer.close()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, '127.0.0.1', 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+
+class FakeTwilioServer:
+    """
+    The Twilio create message endpoint. Takes `latency` seconds per request, answers the first `fail_first`
+    with a 429 (too many requests), and rejects numbers in `invalid` like Twilio does invalid numbers.
+    """
+    def __init__(self, latency=0, fail_first=0, invalid=()):
+        self.latency = latency
+        self.failures_left = fail_first
+        self.invalid = set(invalid)
+        self.messages = []
+
+    async def create_message(self, request):
+        data = await request.post()
+        await asyncio.sleep(self.latency)
+        if self.failures_left > 0:
+            self.failures_left -= 1
+            return web.json_response({'code': 20429, 'message': 'Too Many Requests'}, status=429)
+        if data['To'] in self.invalid:
+            return web.json_response({'code': 21211, 'message': 'Invalid \'To\' Phone Number'}, status=400)
+        self.messages.append(dict(data))
+        return web.json_response({'sid': 'SM%032x' % len(self.messages), 'status': 'queued'}, status=201)
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/2010-04-01/Accounts/{sid}/Messages.json', self.create_message)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        await web.SockSite(self.runner, sock).start()
+        self.url = 'http://127.0.0.1:%d' % sock.getsockname()[1]
+
+    async def stop(self):
+        await self.runner.cleanup()
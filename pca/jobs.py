@@ -0,0 +1,85 @@
+"""
+Progress of bulk actions started from the admin, which fan out into many tasks. Each task reports what it got
+through to its job in redis, and the changelists show the most recent jobs.
+"""
+import time
+import uuid
+import logging
+from datetime import datetime
+
+import redis
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+r = redis.Redis.from_url(settings.REDIS_URL)
+
+JOBS_KEY = 'pca:jobs'
+
+
+def job_key(job_id):
+    return 'pca:jobs:%s' % job_id
+
+
+def start(label, total):
+    """
+    Start tracking the progress of a batch of work kicked off from the admin, like sending alerts.
+    Progress is only for show, so if redis is unavailable the work goes ahead untracked.
+    :return: the job id, or None if it couldn't be tracked.
+    """
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    pipe = r.pipeline()
+    pipe.hmset(job_key(job_id), {'label': label, 'total': total, 'done': 0, 'failed': 0, 'started': now})
+    pipe.expire(job_key(job_id), settings.ADMIN_JOB_TTL)
+    pipe.zadd(JOBS_KEY, {job_id: now})
+    pipe.zremrangebyscore(JOBS_KEY, '-inf', now - settings.ADMIN_JOB_TTL)
+    try:
+        pipe.execute()
+    except redis.RedisError:
+        logger.exception('could not start tracking job %s' % label)
+        return None
+    return job_id
+
+
+def progress(job_id, done=0, failed=0):
+    """
+    Count items of a job as done, and how many of those failed. Does nothing for work which isn't a job,
+    and never fails the task reporting it.
+    """
+    if job_id is None:
+        return
+    pipe = r.pipeline(transaction=False)
+    pipe.hincrby(job_key(job_id), 'done', done)
+    pipe.hincrby(job_key(job_id), 'failed', failed)
+    try:
+        pipe.execute()
+    except redis.RedisError:
+        logger.exception('could not report progress of job %s' % job_id)
+
+
+def recent(limit=10):
+    """The most recently started jobs, newest first. Empty if redis is unavailable, so the admin still works."""
+    try:
+        job_ids = r.zrevrange(JOBS_KEY, 0, limit - 1)
+        pipe = r.pipeline(transaction=False)
+        for job_id in job_ids:
+            pipe.hgetall(job_key(job_id.decode()))
+        results = pipe.execute()
+    except redis.RedisError:
+        return []
+    jobs = []
+    for job in results:
+        if b'label' not in job:
+            continue  # expired
+        job = {k.decode(): v.decode() for k, v in job.items()}
+        total, done = int(job['total']), int(job['done'])
+        jobs.append({
+            'label': job['label'],
+            'total': total,
+            'done': done,
+            'failed': int(job['failed']),
+            'percent': 100 * done // total if total > 0 else 100,
+            'started_at': datetime.fromtimestamp(float(job['started']), timezone.utc),
+        })
+    return jobs
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from pca import metrics
+
+
+def fmt(seconds):
+    return '-' if seconds is None else '%.3fs' % seconds
+
+
+class Command(BaseCommand):
+    help = 'Show how long each stage of sending alerts takes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='clear the recorded latencies')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            metrics.reset()
+            self.stdout.write('Latency metrics cleared.')
+            return
+
+        self.stdout.write('%-20s %8s %10s %10s %10s %10s' % ('stage', 'count', 'mean', 'p50', 'p95', 'p99'))
+        for stage, stats in metrics.summary().items():
+            self.stdout.write('%-20s %8d %10s %10s %10s %10s' % (
+                stage, stats['count'], fmt(stats['mean']), fmt(stats['p50']), fmt(stats['p95']), fmt(stats['p99'])))
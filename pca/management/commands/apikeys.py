@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from pca.credentials import pool
+
+
+class Command(BaseCommand):
+    help = 'Show request metrics and cooldown status for each Penn API key'
+
+    def handle(self, *args, **options):
+        for key, metrics in pool.metrics().items():
+            status = 'cooling down for %ds' % metrics['cooldown'] if metrics['cooldown'] else 'active'
+            self.stdout.write('%s (%s): %d requests, %d ok, %d errors, %d throttled, %d unauthorized' % (
+                key, status, metrics['requests'], metrics['ok'], metrics['errors'],
+                metrics['throttled'], metrics['unauthorized']))
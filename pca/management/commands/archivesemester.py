@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from pca.archive import archive_semester
+
+
+class Command(BaseCommand):
+    help = "Move a past semester's course updates and registrations to the archive tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument('semester', type=str)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--keep-catalog', action='store_true',
+                            help="don't delete the semester's courses and sections")
+
+    def handle(self, *args, **options):
+        try:
+            result = archive_semester(options['semester'], options['batch_size'], options['keep_catalog'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        for table, count in result.items():
+            self.stdout.write('%s: %d' % (table, count))
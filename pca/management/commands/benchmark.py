@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from pca.benchmarks import BENCHMARKS
+
+
+class Command(BaseCommand):
+    help = 'Run a performance benchmark'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(BENCHMARKS.keys()))
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        for label, value in BENCHMARKS[options['name']](repeat=options['repeat']):
+            self.stdout.write('%-30s %s' % (label, value))
@@ -0,0 +1,52 @@
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Measure registration throughput by POSTing signups to a running server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='base URL of the server, like http://localhost:8000')
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=20)
+
+    def handle(self, *args, **options):
+        base = options['url'].rstrip('/')
+        sections = [s['section_id'] for s in requests.get(base + '/courses').json()]
+        if len(sections) == 0:
+            self.stderr.write('No sections in the catalog to register for.')
+            return
+
+        local = threading.local()
+
+        def session():
+            # every thread gets its own session with a CSRF cookie from the homepage
+            if not hasattr(local, 'session'):
+                local.session = requests.Session()
+                local.session.get(base + '/')
+            return local.session
+
+        def register(i):
+            s = session()
+            start = time.perf_counter()
+            res = s.post(base + '/submitted',
+                         data={'course': random.choice(sections), 'email': 'loadtest%d@example.com' % i},
+                         headers={'X-CSRFToken': s.cookies.get('csrftoken', ''), 'Referer': base + '/'})
+            return res.status_code, time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrency']) as pool:
+            results = list(pool.map(register, range(options['requests'])))
+        elapsed = time.perf_counter() - start
+
+        latencies = sorted(latency for _, latency in results)
+        errors = sum(1 for status, _ in results if status != 200)
+        self.stdout.write('%d requests in %.2fs: %.1f requests/sec, %d errors' % (
+            len(results), elapsed, len(results) / elapsed, errors))
+        self.stdout.write('latency p50 %.1fms, p95 %.1fms, p99 %.1fms' % tuple(
+            latencies[int(q * (len(latencies) - 1))] * 1000 for q in (0.5, 0.95, 0.99)))
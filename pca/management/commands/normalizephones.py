@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from pca.models import Registration, normalize_phones
+
+
+class Command(BaseCommand):
+    help = 'Store every registration phone number in E.164 format'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        updated = normalize_phones(Registration.objects.all(), options['batch_size'])
+        self.stdout.write('Normalized %d phone numbers.' % updated)
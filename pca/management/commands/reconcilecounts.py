@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from pca.models import reconcile_pending_counts
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the pending registration counters on sections and report any drift'
+
+    def handle(self, *args, **options):
+        drift = reconcile_pending_counts()
+        for section_id, stored, actual in drift:
+            self.stdout.write('section %d: counter was %d, actually %d pending' % (section_id, stored, actual))
+        self.stdout.write('%d sections had drifted.' % len(drift))
@@ -0,0 +1,103 @@
+import time
+import logging
+from bisect import bisect_left
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+r = redis.Redis.from_url(settings.REDIS_URL)
+
+# Stages of getting an alert out, each timed separately:
+STAGES = (
+    'course_task_queue',  # status change seen (webhook received or poll came back open) -> send_course_alerts starts
+    'alert_task_queue',  # send_alert enqueued -> send_alert starts
+    'render',  # rendering the email and text templates
+    'email_send',  # SMTP send
+    'text_send',  # Twilio send
+    'end_to_end',  # status change seen -> alert sent
+)
+
+# upper bounds (seconds) of the histogram buckets
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, float('inf'))
+
+
+def histogram_key(stage):
+    return 'pca:latency:%s' % stage
+
+
+def observe(stage, seconds):
+    """Count a latency measurement in its histogram bucket. Metrics never get in the way of sending alerts."""
+    bucket = BUCKETS[bisect_left(BUCKETS, seconds)]
+    try:
+        pipe = r.pipeline(transaction=False)
+        pipe.hincrby(histogram_key(stage), str(bucket), 1)
+        pipe.hincrbyfloat(histogram_key(stage), 'sum', seconds)
+        pipe.execute()
+    except redis.RedisError:
+        logger.debug('could not record %s latency', stage, exc_info=True)
+
+
+def observe_since(stage, start):
+    """Record the time since the unix timestamp `start`, if there is one."""
+    if start is not None:
+        observe(stage, time.time() - start)
+
+
+class timed:
+    """Context manager recording the time spent in its block under `stage`."""
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.time()
+
+    def __exit__(self, *exc):
+        observe_since(self.stage, self.start)
+
+
+def bucket_label(bound):
+    """How a bucket is reported. The overflow bucket has no upper bound, and JSON has no infinity."""
+    if bound == float('inf'):
+        return '>%s' % BUCKETS[-2]
+    return bound
+
+
+def percentile(counts, q):
+    """
+    Upper bound of the bucket the `q`th quantile falls in, given counts per bucket in BUCKETS order,
+    or like '>3600' if it's past the last bound.
+    """
+    total = sum(counts)
+    if total == 0:
+        return None
+    seen = 0
+    for bound, count in zip(BUCKETS, counts):
+        seen += count
+        if seen >= q * total:
+            return bucket_label(bound)
+
+
+def summary():
+    """Count, mean and p50/p95/p99 per stage, along with the raw histograms."""
+    pipe = r.pipeline(transaction=False)
+    for stage in STAGES:
+        pipe.hgetall(histogram_key(stage))
+
+    result = {}
+    for stage, hist in zip(STAGES, pipe.execute()):
+        counts = [int(hist.get(str(bound).encode(), 0)) for bound in BUCKETS]
+        total = sum(counts)
+        result[stage] = {
+            'count': total,
+            'mean': float(hist.get(b'sum', 0)) / total if total > 0 else None,
+            'p50': percentile(counts, 0.5),
+            'p95': percentile(counts, 0.95),
+            'p99': percentile(counts, 0.99),
+            'buckets': {str(bucket_label(bound)): count for bound, count in zip(BUCKETS, counts)},
+        }
+    return result
+
+
+def reset():
+    r.delete(*[histogram_key(stage) for stage in STAGES])
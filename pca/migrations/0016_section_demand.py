@@ -0,0 +1,18 @@
+# Generated by Django 2.2 on 2026-10-19 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pca', '0015_auto_20190405_2055'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='section',
+            name='demand',
+            field=models.SmallIntegerField(default=0),
+        ),
+    ]
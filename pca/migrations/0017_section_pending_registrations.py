@@ -0,0 +1,30 @@
+# Generated by Django 2.2 on 2026-10-19 12:00
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def forwards(apps, schema_editor):
+    Section = apps.get_model('pca', 'Section')
+    Registration = apps.get_model('pca', 'Registration')
+    pending = Registration.objects.filter(notification_sent=False).values_list('section_id').annotate(n=Count('id'))
+    sections = []
+    for section_id, n in pending:
+        sections.append(Section(id=section_id, pending_registrations=n))
+    Section.objects.bulk_update(sections, ['pending_registrations'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pca', '0016_section_demand'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='section',
+            name='pending_registrations',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(forwards, migrations.RunPython.noop)
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 2.2 on 2026-10-19 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def forwards(apps, schema_editor):
+    Registration = apps.get_model('pca', 'Registration')
+    parents = dict(Registration.objects.filter(resubscribed_from__isnull=False)
+                   .values_list('id', 'resubscribed_from_id'))
+
+    roots = {}
+
+    def root(reg_id):
+        # walk up the chain iteratively, remembering every root found along the way
+        path = []
+        while reg_id in parents and reg_id not in roots:
+            path.append(reg_id)
+            reg_id = parents[reg_id]
+        found = roots.get(reg_id, reg_id)
+        for r in path:
+            roots[r] = found
+        return found
+
+    regs = [Registration(id=reg_id, resubscription_root_id=root(reg_id)) for reg_id in parents]
+    Registration.objects.bulk_update(regs, ['resubscription_root'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pca', '0017_section_pending_registrations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='registration',
+            name='resubscription_root',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='pca.Registration'),
+        ),
+        migrations.RunPython(forwards, migrations.RunPython.noop)
+    ]
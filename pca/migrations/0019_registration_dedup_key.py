@@ -0,0 +1,57 @@
+# Generated by Django 2.2 on 2026-10-19 12:00
+
+import hashlib
+from collections import Counter
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def pending_key(section_id, email, phone):
+    return hashlib.sha1(('%s|%s|%s' % (section_id, email or '', phone or '')).encode()).hexdigest()
+
+
+def forwards(apps, schema_editor):
+    Registration = apps.get_model('pca', 'Registration')
+    Section = apps.get_model('pca', 'Section')
+    pending = Registration.objects.filter(notification_sent=False).order_by('id') \
+        .values_list('id', 'section_id', 'email', 'phone')
+
+    seen = set()
+    regs = []
+    duplicates = []
+    for reg_id, section_id, email, phone in pending.iterator():
+        key = pending_key(section_id, email, phone)
+        if key in seen:
+            duplicates.append((reg_id, section_id))
+            continue
+        seen.add(key)
+        regs.append(Registration(id=reg_id, dedup_key=key))
+
+    # Newer duplicates of a pending signup couldn't keep a key of their own (and would fail to save again),
+    # and would only send the same alert twice, so the oldest one is kept and the rest are dropped.
+    for i in range(0, len(duplicates), 500):
+        Registration.objects.filter(id__in=[reg_id for reg_id, _ in duplicates[i:i + 500]]).delete()
+    for section_id, n in Counter(section_id for _, section_id in duplicates).items():
+        Section.objects.filter(id=section_id).update(pending_registrations=F('pending_registrations') - n)
+    Registration.objects.bulk_update(regs, ['dedup_key'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pca', '0018_registration_resubscription_root'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='registration',
+            name='dedup_key',
+            field=models.CharField(blank=True, editable=False, max_length=40, null=True, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['department', 'code', 'semester'], name='pca_course_lookup_idx'),
+        ),
+        migrations.RunPython(forwards, migrations.RunPython.noop)
+    ]
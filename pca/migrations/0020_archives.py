@@ -0,0 +1,42 @@
+# Generated by Django 2.2 on 2026-10-19 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pca', '0019_registration_dedup_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedCourseUpdate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('semester', models.CharField(db_index=True, max_length=5)),
+                ('section_code', models.CharField(db_index=True, max_length=32)),
+                ('old_status', models.CharField(choices=[('O', 'Open'), ('C', 'Closed'), ('X', 'Cancelled'), ('', 'Unlisted')], max_length=16)),
+                ('new_status', models.CharField(choices=[('O', 'Open'), ('C', 'Closed'), ('X', 'Cancelled'), ('', 'Unlisted')], max_length=16)),
+                ('created_at', models.DateTimeField()),
+                ('alert_sent', models.BooleanField()),
+                ('request_body', models.BinaryField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedRegistration',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('semester', models.CharField(db_index=True, max_length=5)),
+                ('section_code', models.CharField(db_index=True, max_length=32)),
+                ('original_id', models.IntegerField(unique=True)),
+                ('resubscribed_from_id', models.IntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('email', models.EmailField(blank=True, max_length=254, null=True)),
+                ('phone', models.CharField(blank=True, max_length=100, null=True)),
+                ('notification_sent', models.BooleanField()),
+                ('notification_sent_at', models.DateTimeField(blank=True, null=True)),
+                ('notification_sent_by', models.CharField(blank=True, choices=[('', 'Unsent'), ('LEG', '[Legacy] Sequence of course API requests'), ('WEB', 'Webhook'), ('SERV', 'Course Status Service'), ('ADM', 'Admin Interface')], max_length=16)),
+            ],
+        ),
+    ]
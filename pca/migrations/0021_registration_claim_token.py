@@ -0,0 +1,18 @@
+# Generated by Django 2.2 on 2026-10-19 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pca', '0020_archives'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='registration',
+            name='claim_token',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=32, null=True),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 2.2 on 2026-10-19 12:00
+
+from django.db import migrations, models
+
+
+def forwards(apps, schema_editor):
+    Section = apps.get_model('pca', 'Section')
+    Registration = apps.get_model('pca', 'Registration')
+    sections = Section.objects.filter(registration__isnull=False).distinct() \
+        .values_list('id', 'course__department', 'course__code', 'code', 'course__semester')
+    for id_, dept_code, course_id, section_id, semester in sections:
+        Registration.objects.filter(section_id=id_) \
+            .update(section_code='%s-%s-%s' % (dept_code, course_id, section_id), semester=semester)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pca', '0022_delivery'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='registration',
+            name='section_code',
+            field=models.CharField(blank=True, editable=False, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='registration',
+            name='semester',
+            field=models.CharField(blank=True, editable=False, max_length=5),
+        ),
+        migrations.AlterField(
+            model_name='registration',
+            name='email',
+            field=models.EmailField(blank=True, db_index=True, max_length=254, null=True),
+        ),
+        migrations.AlterField(
+            model_name='registration',
+            name='phone',
+            field=models.CharField(blank=True, db_index=True, max_length=100, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='registration',
+            index=models.Index(fields=['section_code', 'semester'], name='pca_registration_search_idx'),
+        ),
+        migrations.RunPython(forwards, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2 on 2026-10-19 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pca', '0023_registration_search_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='delivery',
+            name='batch_token',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=32, null=True),
+        ),
+    ]
@@ -1,16 +1,27 @@
 import json
+import zlib
+import uuid
+import hashlib
+from functools import lru_cache
+from collections import Counter
 from enum import Enum, auto
 from urllib.parse import urlencode
 import logging
 from smtplib import SMTPRecipientsRefused
 import re
 
-from django.db import models
+from celery import current_app
+from django.db import models, transaction, IntegrityError
+from django.db.models import F, Q, Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.conf import settings
 from django.utils import timezone
 from django import urls
 
-from .alerts import Email, Text
+from .alerts import Email, Text, DeliveryError
+from . import metrics
 from shortener.models import Url
 from options.models import get_value, get_bool
 
@@ -34,6 +45,9 @@ class Instructor(models.Model):
 
 
 class Course(models.Model):
+    class Meta:
+        indexes = [models.Index(fields=['department', 'code', 'semester'], name='pca_course_lookup_idx')]
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -76,6 +90,12 @@ class Section(models.Model):
     meeting_times = models.TextField(blank=True)
     instructors = models.ManyToManyField(Instructor)
 
+    # 0-10 score of how sought after this section is, computed in batch by `tasks.update_demand_scores`
+    demand = models.SmallIntegerField(default=0)
+    # number of registrations waiting on an alert for this section, kept up to date by `Registration`.
+    # `reconcile_pending_counts` rebuilds it if it ever drifts.
+    pending_registrations = models.IntegerField(default=0)
+
     def __str__(self):
         return '%s-%s %s' % (self.course.course_id, self.code, self.course.semester)
 
@@ -143,6 +163,111 @@ def upsert_course_from_opendata(info, semester):
     section.save()
 
 
+@lru_cache(maxsize=4096)
+def normalize_phone(phone):
+    """
+    Phone number in the E.164 format recommended by Twilio, or None if it can't be parsed.
+    Memoized, since the same numbers come in over and over and parsing them isn't cheap.
+    """
+    try:
+        phone_number = phonenumbers.parse(phone, 'US')
+        return phonenumbers.format_number(phone_number, phonenumbers.PhoneNumberFormat.E164)
+    except phonenumbers.phonenumberutil.NumberParseException:
+        # if the phone number is unparseable, don't include it.
+        return None
+
+
+def normalize_phones(registrations, batch_size=500):
+    """
+    Normalize the stored phone numbers of `registrations` (a queryset) in bulk, for backfills.
+    A pending registration which turns out to duplicate another pending one once its number is normalized
+    is deleted, the same way a duplicate signup would have been turned away.
+    :return: number of registrations whose phone number changed.
+    """
+    changed = []
+    updated = 0
+    fields = ('id', 'section_id', 'email', 'phone', 'notification_sent', 'dedup_key')
+    for reg in registrations.exclude(phone=None).only(*fields).iterator(chunk_size=batch_size):
+        phone = normalize_phone(reg.phone)
+        if phone != reg.phone:
+            reg.phone = phone
+            if not reg.notification_sent:
+                reg.dedup_key = pending_key(reg.section_id, reg.email, phone)
+            changed.append(reg)
+        if len(changed) >= batch_size:
+            save_normalized_phones(changed)
+            updated += len(changed)
+            changed = []
+    save_normalized_phones(changed)
+    return updated + len(changed)
+
+
+def save_normalized_phones(changed):
+    """Save one batch of `normalize_phones`, deleting the pending registrations whose new keys are already taken."""
+    keys = [reg.dedup_key for reg in changed if reg.dedup_key is not None]
+    taken = set(Registration.objects.filter(dedup_key__in=keys).exclude(id__in=[reg.id for reg in changed])
+                .values_list('dedup_key', flat=True))
+    kept, duplicates = [], []
+    for reg in changed:
+        if reg.dedup_key is not None and reg.dedup_key in taken:
+            duplicates.append(reg)
+        else:
+            taken.add(reg.dedup_key)
+            kept.append(reg)
+
+    try:
+        with transaction.atomic():
+            Registration.objects.bulk_update(kept, ['phone', 'dedup_key'])
+    except IntegrityError:
+        # a signup with one of the new keys came in meanwhile, so sort out which one by one.
+        for reg in kept:
+            try:
+                with transaction.atomic():
+                    Registration.objects.filter(id=reg.id).update(phone=reg.phone, dedup_key=reg.dedup_key)
+            except IntegrityError:
+                duplicates.append(reg)
+    for reg in duplicates:
+        reg.delete()  # registration_deleted takes it off its section's pending count
+
+
+def pending_key(section_id, email, phone):
+    """Identifies a pending registration by its section and contact info."""
+    return hashlib.sha1(('%s|%s|%s' % (section_id, email or '', phone or '')).encode()).hexdigest()
+
+
+def lookup_sections(course_codes, semester):
+    """
+    Sections with these codes, in a single query. Unlike `get_course_and_section`, never creates rows.
+    :return: map of course code to (section id, (normalized section code, semester)), for the codes which are in
+        the catalog. The second part is what registrations for the section are searched by, see `section_search_keys`.
+    """
+    parsed = {}
+    for course_code in course_codes:
+        try:
+            parsed[course_code] = separate_course_code(course_code)
+        except ValueError:
+            pass
+    if len(parsed) == 0:
+        return {}
+
+    query = Q()
+    for dept_code, course_id, section_id in set(parsed.values()):
+        query |= Q(course__department=dept_code, course__code=course_id, code=section_id)
+    sections = {(dept_code, course_id, section_id): (id_, ('%s-%s-%s' % (dept_code, course_id, section_id), semester))
+                for id_, dept_code, course_id, section_id in
+                Section.objects.filter(query, course__semester=semester)
+                .values_list('id', 'course__department', 'course__code', 'code')}
+    return {course_code: sections[key] for course_code, key in parsed.items() if key in sections}
+
+
+def section_search_keys(section_ids):
+    """Map of section id to the (normalized section code, semester) its registrations are searched by."""
+    return {id_: ('%s-%s-%s' % (dept_code, course_id, section_id), semester) for
+            id_, dept_code, course_id, section_id, semester in
+            Section.objects.filter(id__in=section_ids)
+            .values_list('id', 'course__department', 'course__code', 'code', 'course__semester')}
+
+
 class RegStatus(Enum):
     SUCCESS = auto()
     OPEN_REG_EXISTS = auto()
@@ -155,8 +280,8 @@ class Registration(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
-    email = models.EmailField(blank=True, null=True)
-    phone = models.CharField(blank=True, null=True, max_length=100)
+    email = models.EmailField(blank=True, null=True, db_index=True)
+    phone = models.CharField(blank=True, null=True, max_length=100, db_index=True)
     # section that the user registered to be notified about
     section = models.ForeignKey(Section, on_delete=models.CASCADE)
     # change to True once notification email has been sent out
@@ -177,22 +302,78 @@ class Registration(models.Model):
                                              null=True,
                                              on_delete=models.SET_NULL,
                                              related_name='resubscribed_to')
+    # unique among registrations waiting on an alert, so the database rejects duplicate signups.
+    # null once the alert has been sent. see `pending_key`.
+    dedup_key = models.CharField(max_length=40, blank=True, null=True, unique=True, editable=False)
+
+    # first registration of the resubscription chain this belongs to, null if this is the first one.
+    # lets the latest registration in a chain be found with one indexed lookup.
+    resubscription_root = models.ForeignKey('Registration',
+                                            blank=True,
+                                            null=True,
+                                            on_delete=models.SET_NULL,
+                                            related_name='+')
+
+    # tags the registrations claimed by one call to `claim_registrations`, or inserted by one batch of
+    # `flush_registrations`, so they can be read back. MySQL has no INSERT/UPDATE ... RETURNING.
+    claim_token = models.CharField(max_length=32, blank=True, null=True, editable=False, db_index=True)
+
+    # copies of the section's normalized code (like CIS-120-001) and semester, so the admin can search
+    # registrations by section with an index instead of joining through sections and courses.
+    section_code = models.CharField(max_length=32, blank=True, editable=False)
+    semester = models.CharField(max_length=5, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['section_code', 'semester'], name='pca_registration_search_idx'),
+        ]
 
     def __str__(self):
         return '%s: %s' % (self.email or self.phone, self.section.__str__())
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember the phone number as stored, so saves which don't touch it don't normalize it again
+        instance._stored_phone = instance.phone
+        # and the section, so the search key is only looked up again when it changes
+        instance._stored_section_id = instance.__dict__.get('section_id')
+        return instance
+
     def validate_phone(self):
         """Store phone numbers in the format recommended by Twilio."""
-        try:
-            phone_number = phonenumbers.parse(self.phone, 'US')
-            self.phone = phonenumbers.format_number(phone_number, phonenumbers.PhoneNumberFormat.E164)
-        except phonenumbers.phonenumberutil.NumberParseException:
-            # if the phone number is unparseable, don't include it.
-            self.phone = None
+        self.phone = normalize_phone(self.phone)
 
     def save(self, *args, **kwargs):
-        self.validate_phone()
-        super().save(*args, **kwargs)
+        if self._state.adding or self.phone != getattr(self, '_stored_phone', None):
+            self.validate_phone()
+        self.dedup_key = None if self.notification_sent else pending_key(self.section_id, self.email, self.phone)
+        if self._state.adding:
+            # callers which looked the section up already fill the search keys in themselves
+            stale = not (self.section_code and self.semester)
+        else:
+            stale = self.section_id != getattr(self, '_stored_section_id', None)
+        if stale:
+            self.section_code, self.semester = self.search_keys()
+        created = self.pk is None
+        if self.resubscribed_from_id is not None and self.resubscription_root_id is None:
+            self.resubscription_root_id = self.resubscribed_from.resubscription_root_id or self.resubscribed_from_id
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if created and not self.notification_sent:
+                adjust_pending_count(self.section_id, 1)
+        self._stored_phone = self.phone
+        self._stored_section_id = self.section_id
+
+    def search_keys(self):
+        """
+        The (normalized section code, semester) this registration is searched by: from its section if that's
+        loaded along with its course, or looked up with `section_search_keys` otherwise.
+        """
+        if Registration._meta.get_field('section').is_cached(self) and self.section.id == self.section_id \
+                and Section._meta.get_field('course').is_cached(self.section):
+            return self.section.normalized, self.section.course.semester
+        return section_search_keys([self.section_id])[self.section_id]
 
     @property
     def resub_url(self):
@@ -200,18 +381,43 @@ class Registration(models.Model):
         full_url = '%s%s' % (settings.BASE_URL, urls.reverse('resubscribe', kwargs={'id_': self.id}))
         return Url.objects.get_or_create(full_url).shortened
 
+    def send(self):
+        """
+        Send the text and email for this registration, whether or not it has been claimed, each tracked by a
+        Delivery. Transient failures are retried later by the `retry_deliveries` task.
+        :return: True if everything was sent.
+        """
+        deliveries = create_deliveries([self])
+        with metrics.timed('render'):
+            senders = {Delivery.TEXT: Text(self), Delivery.EMAIL: Email(self)}
+        for delivery in deliveries:
+            with metrics.timed('%s_send' % delivery.channel):
+                delivery.attempt(senders[delivery.channel].send_alert)
+        logging.debug('NOTIFICATION SENT FOR ' + self.__str__())
+        save_deliveries(deliveries)
+        return all(delivery.status == Delivery.SENT for delivery in deliveries)
+
     def alert(self, forced=False, sent_by=''):
-        if forced or not self.notification_sent:
-            text_result = Text(self).send_alert()
-            email_result = Email(self).send_alert()
-            logging.debug('NOTIFICATION SENT FOR ' + self.__str__())
+        """
+        Send the alert for this registration, unless it has already been sent (or claimed by another worker).
+        `forced` sends it again anyway.
+        """
+        if len(claim_registrations([self.id], sent_by)) > 0:
+            self.refresh_from_db(fields=['notification_sent', 'notification_sent_at', 'notification_sent_by',
+                                         'dedup_key', 'claim_token'])
+        elif forced:
             self.notification_sent = True
             self.notification_sent_at = timezone.now()
             self.notification_sent_by = sent_by
             self.save()
-            return email_result is not None and text_result is not None  # True if no error in email/text.
         else:
             return False
+        return self.send()
+
+    def latest_in_chain(self):
+        """Most recent registration in this registration's resubscription chain."""
+        root_id = self.resubscription_root_id or self.id
+        return Registration.objects.filter(Q(id=root_id) | Q(resubscription_root_id=root_id)).latest('id')
 
     def resubscribe(self):
         """
@@ -225,9 +431,7 @@ class Registration(models.Model):
         be created.
         :return: Registration object for the resubscription
         """
-        most_recent_reg = self
-        while hasattr(most_recent_reg, 'resubscribed_to'):  # follow the chain of resubscriptions to the most recent one.
-            most_recent_reg = most_recent_reg.resubscribed_to
+        most_recent_reg = self.latest_in_chain()
 
         if not most_recent_reg.notification_sent:  # if a notification hasn't been sent on this recent one,
             return most_recent_reg  # don't create duplicate registrations for no reason.
@@ -236,27 +440,288 @@ class Registration(models.Model):
                                         phone=self.phone,
                                         section=self.section,
                                         resubscribed_from=most_recent_reg)
-        new_registration.save()
+        try:
+            with transaction.atomic():
+                new_registration.save()
+        except IntegrityError:
+            # they've already signed up for this section again some other way
+            return Registration.objects.get(dedup_key=new_registration.dedup_key)
         return new_registration
 
 
-def register_for_course(course_code, email_address, phone):
+def claim_registrations(ids, sent_by=''):
+    """
+    Mark the registrations in `ids` which are still waiting on an alert as sent, with one conditional UPDATE.
+    Each row can only be flipped once, so when tasks race to alert the same section (or a task is redelivered),
+    every registration is claimed by exactly one of them, and no lock is held while the alerts go out.
+    MySQL has no UPDATE ... RETURNING, so the claimed rows are tagged with a token and read back by it.
+    :return: ids of the registrations claimed by this call, which it is now responsible for alerting.
+    """
+    if len(ids) == 0:
+        return []
+    token = uuid.uuid4().hex
+    now = timezone.now()
+    with transaction.atomic():
+        updated = Registration.objects.filter(id__in=ids, notification_sent=False).update(
+            notification_sent=True, notification_sent_at=now, notification_sent_by=sent_by, updated_at=now,
+            dedup_key=None, claim_token=token)
+        if updated == 0:
+            return []
+        claimed = list(Registration.objects.filter(claim_token=token).values_list('id', 'section_id'))
+        for section_id, count in Counter(section_id for _, section_id in claimed).items():
+            adjust_pending_count(section_id, -count)
+    return [id_ for id_, _ in claimed]
+
+
+def release_registrations(ids):
+    """
+    Undo `claim_registrations` for registrations whose alerts never went out, like when queueing them failed,
+    so they're alerted the next time their section opens. A registration stays claimed if its contact info
+    has signed up for the section again in the meantime, since that signup will be alerted instead.
+    :return: ids of the registrations released.
+    """
+    released = []
+    claimed = Registration.objects.filter(id__in=ids, notification_sent=True).only('id', 'section_id', 'email', 'phone')
+    for reg in claimed:
+        try:
+            with transaction.atomic():
+                Registration.objects.filter(id=reg.id).update(
+                    notification_sent=False, notification_sent_at=None, notification_sent_by='',
+                    updated_at=timezone.now(), dedup_key=pending_key(reg.section_id, reg.email, reg.phone),
+                    claim_token=None)
+                adjust_pending_count(reg.section_id, 1)
+        except IntegrityError:
+            continue
+        released.append(reg.id)
+    return released
+
+
+def adjust_pending_count(section_id, delta):
+    """Atomically add `delta` to a section's pending registration counter."""
+    Section.objects.filter(id=section_id).update(pending_registrations=F('pending_registrations') + delta)
+
+
+def pending_count():
+    """The number of registrations waiting on an alert for the section being updated, as an `UPDATE` value."""
+    pending = Registration.objects.filter(section=OuterRef('pk'), notification_sent=False) \
+        .order_by().values('section').annotate(n=Count('id')).values('n')
+    return Coalesce(Subquery(pending, output_field=models.IntegerField()), 0)
+
+
+def reconcile_pending_counts(section_ids=None):
+    """
+    Rebuild pending registration counters from the registrations themselves. Drift is found with one grouped
+    query, and the counters which drifted are recounted in the same `UPDATE` that sets them, so concurrent
+    `adjust_pending_count`s aren't overwritten with a count read beforehand.
+    :param section_ids: only reconcile these sections. All sections if not given.
+    :return: list of (section id, stored count, actual count) for every section whose counter had drifted.
+    """
+    sections = Section.objects.all()
+    pending = Registration.objects.filter(notification_sent=False)
+    if section_ids is not None:
+        sections = sections.filter(id__in=section_ids)
+        pending = pending.filter(section_id__in=section_ids)
+    actual = dict(pending.values_list('section_id').annotate(n=Count('id')))
+
+    drift = []
+    for section_id, stored in sections.values_list('id', 'pending_registrations').iterator():
+        count = actual.get(section_id, 0)
+        if count != stored:
+            drift.append((section_id, stored, count))
+    if len(drift) > 0:
+        Section.objects.filter(id__in=[section_id for section_id, _, _ in drift]) \
+            .update(pending_registrations=pending_count())
+    return drift
+
+
+@receiver(post_delete, sender=Registration)
+def registration_deleted(sender, instance, **kwargs):
+    if not instance.notification_sent:
+        adjust_pending_count(instance.section_id, -1)
+
+
+def prepare_registration(course_code, email_address, phone):
+    """
+    Validate a signup against the catalog without writing anything.
+    :return: (None, unsaved Registration) if it's valid, or (RegStatus of the problem, None).
+    """
+    phone = normalize_phone(phone)
     if not email_address and not phone:
-        return RegStatus.NO_CONTACT_INFO
-    course, section = get_course_and_section(course_code, get_current_semester())
-    registration = Registration(section=section, email=email_address, phone=phone)
-    registration.validate_phone()
-
-    if Registration.objects.filter(section=section,
-                                   email=email_address,
-                                   phone=registration.phone,
-                                   notification_sent=False).exists():
-        return RegStatus.OPEN_REG_EXISTS
+        return RegStatus.NO_CONTACT_INFO, None
+    sections = lookup_sections([course_code], get_current_semester())
+    if course_code not in sections:
+        return RegStatus.COURSE_NOT_FOUND, None
+    section_id, (section_code, semester) = sections[course_code]
+    return None, Registration(section_id=section_id, email=email_address, phone=phone,
+                              section_code=section_code, semester=semester)
 
-    registration.save()
+
+def register_for_course(course_code, email_address, phone):
+    error, registration = prepare_registration(course_code, email_address, phone)
+    if error is not None:
+        return error
+
+    # duplicate pending registrations are caught by the unique dedup_key rather than checked for first,
+    # so concurrent signups can't race past the check.
+    try:
+        with transaction.atomic():
+            registration.save()
+    except IntegrityError:
+        return RegStatus.OPEN_REG_EXISTS
     return RegStatus.SUCCESS
 
 
+def register_for_sections(course_codes, email_address, phone):
+    """
+    Register one contact for alerts on many sections at once: the contact is validated once,
+    the sections are looked up in one query and the registrations are inserted with one bulk_create.
+    :return: map of course code to the RegStatus of its registration.
+    """
+    course_codes = list(dict.fromkeys(course_codes))  # listing a section twice registers for it once
+    phone = normalize_phone(phone)
+    if not email_address and not phone:
+        return {course_code: RegStatus.NO_CONTACT_INFO for course_code in course_codes}
+
+    sections = lookup_sections(course_codes, get_current_semester())
+    results = {}
+    candidates = []
+    for course_code in course_codes:
+        if course_code not in sections:
+            results[course_code] = RegStatus.COURSE_NOT_FOUND
+        else:
+            section_id, (section_code, semester) = sections[course_code]
+            candidates.append((course_code, Registration(section_id=section_id,
+                                                         email=email_address,
+                                                         phone=phone,
+                                                         dedup_key=pending_key(section_id, email_address, phone),
+                                                         section_code=section_code,
+                                                         semester=semester)))
+
+    existing = set(Registration.objects.filter(dedup_key__in=[reg.dedup_key for _, reg in candidates])
+                   .values_list('dedup_key', flat=True))
+    new = []
+    spellings = {}  # the same section could be listed under different spellings, like CIS-120-001 and cis120001
+    for course_code, reg in candidates:
+        if reg.dedup_key in spellings:
+            continue
+        spellings[reg.dedup_key] = course_code
+        if reg.dedup_key in existing:
+            results[course_code] = RegStatus.OPEN_REG_EXISTS
+        else:
+            new.append((course_code, reg))
+            results[course_code] = RegStatus.SUCCESS
+
+    try:
+        with transaction.atomic():
+            Registration.objects.bulk_create([reg for _, reg in new])
+            # every section gets at most one new registration, so one UPDATE bumps all their counters
+            Section.objects.filter(id__in=[reg.section_id for _, reg in new]) \
+                .update(pending_registrations=F('pending_registrations') + 1)
+    except IntegrityError:
+        # lost a race with a concurrent signup for one of the sections, so sort out which one by one.
+        for course_code, reg in new:
+            reg.pk = None
+            try:
+                with transaction.atomic():
+                    reg.save()
+            except IntegrityError:
+                results[course_code] = RegStatus.OPEN_REG_EXISTS
+    for course_code, reg in candidates:
+        results[course_code] = results[spellings[reg.dedup_key]]
+    return results
+
+
+class Delivery(models.Model):
+    """One channel of the alert for a registration, and how sending it went."""
+    EMAIL = 'email'
+    TEXT = 'text'
+    CHANNEL_CHOICES = (
+        (EMAIL, 'Email'),
+        (TEXT, 'Text'),
+    )
+    PENDING = 'pending'
+    SENT = 'sent'
+    RETRYING = 'retrying'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+        (RETRYING, 'Retrying'),
+        (FAILED, 'Failed'),
+    )
+    registration = models.ForeignKey(Registration, on_delete=models.CASCADE, related_name='deliveries')
+    channel = models.CharField(max_length=8, choices=CHANNEL_CHOICES)
+    status = models.CharField(max_length=8, choices=STATUS_CHOICES, default=PENDING, db_index=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    # tags the deliveries inserted by one call to `create_deliveries`, so they can be read back
+    batch_token = models.CharField(max_length=32, blank=True, null=True, editable=False, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return '%s %s: %s' % (self.channel, self.registration_id, self.status)
+
+    def record(self, error=None, attempts=1):
+        """
+        Record the outcome of sending, without saving. Transient errors are retried until the delivery
+        has been attempted DELIVERY_MAX_ATTEMPTS times.
+        :param error: the DeliveryError the last attempt failed with, None if it was sent.
+        """
+        self.attempts += attempts
+        self.updated_at = timezone.now()
+        if error is None:
+            self.status = Delivery.SENT
+            self.last_error = ''
+        else:
+            self.last_error = str(error)
+            retry = error.transient and self.attempts < settings.DELIVERY_MAX_ATTEMPTS
+            self.status = Delivery.RETRYING if retry else Delivery.FAILED
+
+    def attempt(self, send):
+        """Try sending once with `send`, the `send_alert` of one of the senders in pca/alerts.py."""
+        try:
+            error = None if send() else DeliveryError('not sent')
+        except DeliveryError as e:
+            error = e
+        self.record(error)
+
+
+def create_deliveries(registrations):
+    """Pending deliveries for every channel the registrations have contact details for, inserted in bulk."""
+    token = uuid.uuid4().hex
+    Delivery.objects.bulk_create([Delivery(registration=reg, channel=channel, batch_token=token)
+                                  for reg in registrations
+                                  for channel, to in [(Delivery.TEXT, reg.phone), (Delivery.EMAIL, reg.email)]
+                                  if to is not None])
+    # MySQL doesn't return the ids of bulk inserted rows, so they are tagged and read back. Only this call's,
+    # since another call may be sending the same registrations (like a forced alert) at the same time.
+    by_id = {reg.id: reg for reg in registrations}
+    deliveries = list(Delivery.objects.filter(batch_token=token))
+    for delivery in deliveries:
+        delivery.registration = by_id[delivery.registration_id]
+    return deliveries
+
+
+def retry_backoff(attempts):
+    """Seconds before retrying a delivery which has been attempted `attempts` times."""
+    return settings.DELIVERY_RETRY_BACKOFF * 2 ** (attempts - 1)
+
+
+def save_deliveries(deliveries):
+    """
+    Save the outcomes recorded on `deliveries` with one bulk update, and queue the ones to retry,
+    in one `retry_deliveries` task per backoff.
+    """
+    Delivery.objects.bulk_update(deliveries, ['status', 'attempts', 'last_error', 'updated_at'])
+    retries = {}
+    for delivery in deliveries:
+        if delivery.status == Delivery.RETRYING:
+            retries.setdefault(retry_backoff(delivery.attempts), []).append(delivery.id)
+    for backoff, ids in retries.items():
+        current_app.send_task('pca.tasks.retry_deliveries', (ids, ), countdown=backoff)
+
+
 class CourseUpdate(models.Model):
     STATUS_CHOICES = (
         ('O', 'Open'),
@@ -296,3 +761,42 @@ def update_course_from_record(update):
         section.status = update.new_status
         section.save()
 
+
+# Archives of past semesters. Rows are flattened (sections are referenced by code rather than foreign key)
+# so the semester's courses and sections can be dropped from the hot tables. See `pca.archive`.
+
+class ArchivedCourseUpdate(models.Model):
+    semester = models.CharField(max_length=5, db_index=True)
+    section_code = models.CharField(max_length=32, db_index=True)
+    old_status = models.CharField(max_length=16, choices=CourseUpdate.STATUS_CHOICES)
+    new_status = models.CharField(max_length=16, choices=CourseUpdate.STATUS_CHOICES)
+    created_at = models.DateTimeField()
+    alert_sent = models.BooleanField()
+    # zlib compressed
+    request_body = models.BinaryField()
+
+    def __str__(self):
+        d = dict(CourseUpdate.STATUS_CHOICES)
+        return f'{self.section_code} {self.semester} - {d[self.old_status]} to {d[self.new_status]}'
+
+    @property
+    def body(self):
+        return zlib.decompress(self.request_body).decode()
+
+
+class ArchivedRegistration(models.Model):
+    semester = models.CharField(max_length=5, db_index=True)
+    section_code = models.CharField(max_length=32, db_index=True)
+    # id of the registration in the hot table, so resubscription chains can still be followed
+    original_id = models.IntegerField(unique=True)
+    resubscribed_from_id = models.IntegerField(blank=True, null=True)
+
+    created_at = models.DateTimeField()
+    email = models.EmailField(blank=True, null=True)
+    phone = models.CharField(blank=True, null=True, max_length=100)
+    notification_sent = models.BooleanField()
+    notification_sent_at = models.DateTimeField(blank=True, null=True)
+    notification_sent_by = models.CharField(max_length=16, choices=Registration.METHOD_CHOICES, blank=True)
+
+    def __str__(self):
+        return '%s: %s %s' % (self.email or self.phone, self.section_code, self.semester)
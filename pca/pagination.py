@@ -0,0 +1,109 @@
+import hashlib
+import logging
+
+import redis
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+logger = logging.getLogger(__name__)
+r = redis.Redis.from_url(settings.REDIS_URL)
+
+
+def estimated_count(model, using='default'):
+    """
+    Number of rows in a model's table according to the database's statistics, without counting them.
+    None if the database doesn't keep any we can read.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute('SELECT table_rows FROM information_schema.tables '
+                           'WHERE table_schema = DATABASE() AND table_name = %s', [table])
+        elif connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None or row[0] is None or row[0] < 0:  # postgres says -1 for tables which were never analyzed
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for admin changelists over big tables.
+
+    Unfiltered lists of tables with at least ADMIN_ESTIMATED_COUNT_MIN rows take their count from the table
+    statistics instead of a COUNT(*) over the whole table. The estimate can be off by a bit, so the last
+    page might come up short or empty.
+
+    Pages deeper than ADMIN_SEEK_OFFSET rows into a list ordered by primary key alone (the default) are
+    fetched by seeking: the last key of every such page is kept in redis for ADMIN_SEEK_CURSOR_TTL seconds,
+    and the page after it is read with an indexed range from there (like `pk < cursor`), with no OFFSET at all.
+    Paging through a list one page at a time only ever seeks. Jumping straight to a deep page nobody has
+    paged to yet finds its first key by skipping through the primary key index alone, which is still linear
+    in the offset but much cheaper than an OFFSET over whole rows.
+    """
+    @cached_property
+    def count(self):
+        if not self.object_list.query.where:
+            estimate = estimated_count(self.object_list.model, self.object_list.db)
+            if estimate is not None and estimate >= settings.ADMIN_ESTIMATED_COUNT_MIN:
+                return estimate
+        return super().count
+
+    def pk_ordering(self):
+        """'asc' or 'desc' if the list is ordered by primary key alone, None otherwise."""
+        order_by = self.object_list.query.order_by
+        if len(order_by) != 1:
+            return None
+        pk_name = self.object_list.model._meta.pk.name
+        field = order_by[0]
+        if field in ('pk', pk_name):
+            return 'asc'
+        if field in ('-pk', '-' + pk_name):
+            return 'desc'
+        return None
+
+    def cursor_key(self, number):
+        """Redis key of the last primary key on page `number` of this list."""
+        query = '%s|%s|%s' % (self.object_list.query, self.per_page, number)
+        return 'pca:admin:seek:%s' % hashlib.sha1(query.encode()).hexdigest()
+
+    def get_cursor(self, number):
+        try:
+            cursor = r.get(self.cursor_key(number))
+        except redis.RedisError:
+            logger.debug('could not read seek cursor', exc_info=True)
+            return None
+        return None if cursor is None else int(cursor)
+
+    def set_cursor(self, number, pk):
+        try:
+            r.set(self.cursor_key(number), pk, ex=settings.ADMIN_SEEK_CURSOR_TTL)
+        except redis.RedisError:
+            logger.debug('could not save seek cursor', exc_info=True)
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        ordering = self.pk_ordering()
+        if ordering is None or bottom < settings.ADMIN_SEEK_OFFSET or self.object_list.query.is_empty():
+            return super().page(number)
+
+        cursor = self.get_cursor(number - 1)
+        if cursor is not None:
+            lookup = 'pk__lt' if ordering == 'desc' else 'pk__gt'
+            rows = list(self.object_list.filter(**{lookup: cursor})[:self.per_page])
+        else:
+            first = list(self.object_list.values_list('pk', flat=True)[bottom:bottom + 1])
+            if len(first) == 0:
+                return self._get_page([], number, self)
+            lookup = 'pk__lte' if ordering == 'desc' else 'pk__gte'
+            rows = list(self.object_list.filter(**{lookup: first[0]})[:self.per_page])
+        if len(rows) > 0:
+            self.set_cursor(number, rows[-1].pk)
+        return self._get_page(rows, number, self)
@@ -0,0 +1,94 @@
+import time
+import logging
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+r = redis.Redis.from_url(settings.REDIS_URL)
+
+# Refill the bucket based on the time since it was last touched, then try to take `requested` tokens.
+# Time comes from the redis server rather than the callers, so workers with skewed clocks agree on it.
+# Returns the number of seconds the caller has to wait before the request could succeed (0 if it did),
+# as a string since redis truncates Lua numbers to integers.
+TOKEN_BUCKET_SCRIPT = '''
+redis.replicate_commands()
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= requested then
+    tokens = tokens - requested
+else
+    wait = (requested - tokens) / rate
+end
+
+redis.call('HMSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) * 2)
+return tostring(wait)
+'''
+
+
+class RateLimitExceeded(Exception):
+    pass
+
+
+class TokenBucket:
+    """
+    Token bucket stored in redis, so every web and celery process drawing from the same bucket
+    shares one budget. `rate` is the number of requests allowed per `period` seconds, and up to `burst`
+    of them can go at once, so no `period` long window ever sees more than `rate + burst` requests.
+    """
+    def __init__(self, name, rate, period=60, burst=1):
+        self.key = 'pca:ratelimit:%s' % name
+        self.capacity = burst
+        self.rate = rate / period
+        self.script = r.register_script(TOKEN_BUCKET_SCRIPT)
+
+    def try_acquire(self, tokens=1):
+        """Take `tokens` from the bucket if possible. Returns the seconds to wait, 0 on success."""
+        return float(self.script(keys=[self.key], args=[self.capacity, self.rate, tokens]))
+
+    def peek(self, state, now):
+        """
+        Number of tokens in the bucket given its raw `HMGET tokens ts` state, without taking any.
+        :param now: the redis server's time, as returned by `TIME`.
+        """
+        tokens, ts = state
+        if tokens is None or ts is None:
+            return self.capacity
+        now = now[0] + now[1] / 1000000
+        return min(self.capacity, float(tokens) + max(0, now - float(ts)) * self.rate)
+
+    def acquire(self, tokens=1, timeout=None):
+        """Block until `tokens` can be taken from the bucket, or raise RateLimitExceeded after `timeout` seconds."""
+        if timeout is None:
+            timeout = settings.API_RATE_LIMIT_TIMEOUT
+        deadline = time.time() + timeout
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                return
+            if time.time() + wait > deadline:
+                raise RateLimitExceeded('%s: no tokens available within %ss' % (self.key, timeout))
+            logger.debug('%s throttled, waiting %.2fs', self.key, wait)
+            time.sleep(wait)
+
+
+_buckets = {}
+
+
+def get_bucket(name):
+    """Get the API token bucket for the credential `name`. Every credential has its own budget."""
+    if name not in _buckets:
+        _buckets[name] = TokenBucket(name, settings.API_RATE_LIMIT, settings.API_RATE_LIMIT_PERIOD,
+                                     settings.API_RATE_LIMIT_BURST)
+    return _buckets[name]
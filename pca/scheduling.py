@@ -0,0 +1,128 @@
+import math
+import time
+from datetime import timedelta
+
+import redis
+from django.conf import settings
+from django.db.models import Count, F
+from django.utils import timezone
+
+from . import db
+from .models import CourseUpdate
+
+r = redis.Redis.from_url(settings.REDIS_URL)
+
+
+def due_key(semester):
+    return 'pca:polls:due:%s' % semester
+
+
+def last_poll_key(semester):
+    return 'pca:polls:last:%s' % semester
+
+
+def record_poll(semester, section_code):
+    """
+    Remember when a section was polled, in a hash per semester. Polls longer ago than POLL_STALENESS_CAP count
+    the same as no poll at all, so the hash expires once its semester hasn't been polled for that long.
+    """
+    pipe = r.pipeline()
+    pipe.hset(last_poll_key(semester), section_code, time.time())
+    pipe.expire(last_poll_key(semester), settings.POLL_STALENESS_CAP)
+    pipe.execute()
+
+
+def get_last_polls(semester, section_codes):
+    """Map of section code to the timestamp it was last polled at, for sections which have been polled."""
+    if len(section_codes) == 0:
+        return {}
+    return {code: float(ts) for code, ts in zip(section_codes, r.hmget(last_poll_key(semester), section_codes))
+            if ts is not None}
+
+
+def get_volatility(semester):
+    """Number of status changes per section in the recent past, in a single grouped query."""
+    since = timezone.now() - timedelta(hours=settings.POLL_VOLATILITY_HOURS)
+    with db.replica():
+        updates = list(CourseUpdate.objects.filter(section__course__semester=semester, created_at__gte=since)
+                       .exclude(old_status=F('new_status'))
+                       .values_list('section__course__department', 'section__course__code', 'section__code')
+                       .annotate(changes=Count('id')))
+    return {'%s-%s-%s' % (dept, course, section): changes for dept, course, section, changes in updates}
+
+
+def priority(pending, changes, since_poll):
+    """
+    How urgently a section should be polled. Grows with the number of students waiting on it,
+    with how often its status has changed recently, and with the time since it was last polled,
+    so quiet sections still get their turn eventually.
+    """
+    staleness = min(since_poll, settings.POLL_STALENESS_CAP) / settings.POLL_STALENESS_PERIOD
+    return math.log2(1 + pending) * (1 + changes) * (1 + staleness)
+
+
+def rank_sections(semester, alerts, volatility=None):
+    """
+    Order sections by polling priority.
+    :param alerts: map of section code to pending registration ids, from `collect_registrations`.
+    :param volatility: status changes per section, from `get_volatility`. Queried if not given.
+    :return: section codes, most urgent first.
+    """
+    now = time.time()
+    if volatility is None:
+        volatility = get_volatility(semester)
+    last_polls = get_last_polls(semester, list(alerts.keys()))
+
+    def score(code):
+        since_poll = now - last_polls.get(code, 0)
+        return priority(len(alerts[code]), volatility.get(code, 0), since_poll)
+
+    return sorted(alerts.keys(), key=score, reverse=True)
+
+
+def poll_interval(changes):
+    """
+    Seconds until a section should be polled again. Sections which flip between open and closed
+    a lot (like during add/drop) are polled every POLL_INTERVAL_MIN seconds, while sections whose
+    status hasn't changed recently are only polled every POLL_INTERVAL_MAX seconds.
+    """
+    return max(settings.POLL_INTERVAL_MIN, settings.POLL_INTERVAL_MAX / (1 + changes))
+
+
+def due_sections(semester, alerts):
+    """
+    Drain the sections which are due for a poll from the schedule, a redis sorted set of section codes
+    scored by their next due time. Sections with pending registrations which were never scheduled are
+    due right away, and sections which no longer have pending registrations are dropped.
+    :param alerts: map of section code to pending registration ids, from `collect_registrations`.
+    :return: the subset of `alerts` which is due.
+    """
+    key = due_key(semester)
+    pipe = r.pipeline()
+    if len(alerts) > 0:
+        pipe.zadd(key, {code: 0 for code in alerts}, nx=True)
+    pipe.zrangebyscore(key, '-inf', time.time())
+    due = pipe.execute()[-1]
+
+    due = {code.decode() for code in due}
+    stale = [code for code in due if code not in alerts]
+    if len(stale) > 0:
+        r.zrem(key, *stale)
+    return {code: regs for code, regs in alerts.items() if code in due}
+
+
+def lease_polls(semester, section_codes):
+    """
+    Push back the next due time of sections being dispatched for a poll by POLL_LEASE seconds, so they aren't
+    dispatched again while their poll is queued or running. `schedule_poll` sets the real next due time once
+    the poll completes, and a section whose poll was lost becomes due again when the lease runs out.
+    """
+    if len(section_codes) == 0:
+        return
+    r.zadd(due_key(semester), {code: time.time() + settings.POLL_LEASE for code in section_codes})
+
+
+def schedule_poll(semester, section_code, changes):
+    """Set the next due time of a section which was just polled based on its recent status changes."""
+    # xx: sections dropped from the schedule while they were being polled stay dropped
+    r.zadd(due_key(semester), {section_code: time.time() + poll_interval(changes)}, xx=True)
@@ -0,0 +1,90 @@
+import re
+import time
+from bisect import bisect_left
+from itertools import islice
+
+from django.conf import settings
+
+TOKEN_RE = re.compile(r'[a-z]+|\d+')
+
+
+def tokenize(text):
+    """Lowercase letter and digit runs, so `CIS-120-001` and `cis120001` both give `cis`, `120`, `001`."""
+    tokens = []
+    for token in TOKEN_RE.findall(text.lower()):
+        if token.isdigit() and len(token) > 3:
+            # course and section numbers run together, like the `120001` in `CIS120001`
+            tokens.extend(token[i:i + 3] for i in range(0, len(token), 3))
+        else:
+            tokens.append(token)
+    return tokens
+
+
+def section_tokens(section):
+    """Tokens a section can be found by: department, course and section number, title words and instructors."""
+    tokens = set(tokenize(section['section_id']))
+    tokens.update(tokenize(section['course_title']))
+    for instructor in section['instructors']:
+        tokens.update(tokenize(instructor))
+    return tokens
+
+
+class SearchIndex:
+    """
+    Prefix index over the course catalog: every (token, section) pair in one sorted array,
+    so the sections with a token starting with some prefix are a contiguous range found by bisection.
+    """
+    def __init__(self, sections):
+        self.sections = sorted(sections, key=lambda s: s['section_id'])
+        tokens = [section_tokens(s) for s in self.sections]
+        # every section's tokens each preceded by a NUL, so a prefix check is one substring search
+        self.section_text = [''.join('\0' + token for token in t) for t in tokens]
+        entries = sorted((token, i) for i, t in enumerate(tokens) for token in t)
+        self.tokens = [token for token, _ in entries]
+        self.ids = [i for _, i in entries]
+
+    def prefix_range(self, prefix):
+        lo = bisect_left(self.tokens, prefix)
+        hi = bisect_left(self.tokens, prefix + '\uffff', lo)
+        return lo, hi
+
+    def search(self, query, limit=100):
+        """
+        Sections matching every token in `query` as a prefix of one of their tokens.
+        Candidates come from the narrowest token's range, so only a handful get checked against the rest.
+        """
+        prefixes = tokenize(query)
+        if len(prefixes) == 0:
+            return []
+
+        ranges = sorted(((self.prefix_range(p), p) for p in prefixes), key=lambda r: r[0][1] - r[0][0])
+        lo, hi = ranges[0][0]
+        rest = ['\0' + p for _, p in ranges[1:]]
+
+        results, seen = [], set()
+        for i in islice(self.ids, lo, hi):
+            if i in seen:
+                continue
+            seen.add(i)
+            text = self.section_text[i]
+            if all(p in text for p in rest):
+                results.append(self.sections[i])
+                if len(results) >= limit:
+                    break
+        return results
+
+
+_index = None
+_built_at = 0
+
+
+def get_index(sections):
+    """
+    Per-process search index, rebuilt every SEARCH_INDEX_TTL seconds.
+    :param sections: callable returning the catalog, as generated by `generate_course_json`.
+    """
+    global _index, _built_at
+    if _index is None or time.time() - _built_at > settings.SEARCH_INDEX_TTL:
+        _index = SearchIndex(sections())
+        _built_at = time.time()
+    return _index
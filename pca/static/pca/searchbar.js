@@ -19,6 +19,27 @@ function getDemandIcon(demand) {
   }
 }
 
+// Expand the compact columnar catalog format (see pca/catalog.py) into one object per section.
+function expandCourses(catalog) {
+  var courses = catalog.courses;
+  var columns = catalog.sections;
+  var extra = Object.keys(columns).filter(function(field) {
+    return ['course', 'code', 'instructors', 'meeting_days'].indexOf(field) === -1;
+  });
+  return columns.course.map(function(course, i) {
+    var section = {
+      section_id: courses.course_id[course] + '-' + columns.code[i],
+      course_title: courses.title[course],
+      instructors: columns.instructors[i].map(function(j) { return catalog.instructors[j]; }),
+      meeting_days: columns.meeting_days[i].map(function(j) { return catalog.meetings[j]; })
+    };
+    extra.forEach(function(field) {
+      section[field] = columns[field][i];
+    });
+    return section;
+  });
+}
+
 $(document).ready(function(){
   var courses = new Bloodhound({
     datumTokenizer: Bloodhound.tokenizers.obj.nonword('section_id'),
@@ -32,11 +53,11 @@ $(document).ready(function(){
         return Bloodhound.tokenizers.nonword(word)
       }
     },
-    prefetch: '/courses'
-    // remote: {
-    //   url: '/courses?dept=%QUERY',
-    //   wildcard: '%QUERY'
-    // }
+    remote: {
+      url: '/courses/search?format=compact&q=%QUERY',
+      wildcard: '%QUERY',
+      transform: expandCourses
+    }
     });
 
   $('#bloodhound #courseTypeahead').typeahead({
@@ -1,13 +1,21 @@
 import redis
 import json
+import math
+import time
+import uuid
 import logging
+from datetime import timedelta
 from celery import shared_task
 
 from .models import *
-from pca import api
+from .alerts import Email, Text
+from pca import api, scheduling, metrics, catalog, db, jobs
 from options.models import get_value, get_bool
 
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q, Max, Subquery
+from django.utils import timezone
 
 logger = logging.getLogger(__name__)
 r = redis.Redis.from_url(settings.REDIS_URL)
@@ -22,8 +30,19 @@ def generate_course_json(semester=None, use_cache=True):
         if sections is not None:
             return json.loads(sections)
 
+    sections = build_course_json(semester)
+    r.set('sections', json.dumps(sections))
+    return sections
+
+
+def build_course_json(semester):
+    """The catalog of a semester's sections, straight from the database without touching the cache."""
+    with db.replica():
+        section_rows = list(Section.objects.filter(course__semester=semester)
+                            .select_related('course').prefetch_related('instructors'))
+
     sections = []
-    for section in Section.objects.filter(course__semester=semester):
+    for section in section_rows:
         # {'section_id': section_id, 'course_title': course_title, 'instructors': instructors,
         #  'meeting_days': meeting_days}
         # meetings = json.loads('{"meetings": "%s"}' % section.meeting_times)['meetings']
@@ -35,17 +54,68 @@ def generate_course_json(semester=None, use_cache=True):
             'section_id': section.normalized,
             'course_title': section.course.title,
             'instructors': list(map(lambda i: i.name, section.instructors.all())),
-            'meeting_days': meetings
+            'meeting_days': meetings,
+            'demand': section.demand,
         })
+    return sections
+
+
+def generate_compact_course_json(semester=None, use_cache=True):
+    """The catalog from `generate_course_json` in the compact columnar format from `catalog.compact`."""
+    if use_cache:
+        sections = r.get('sections:compact')
+        if sections is not None:
+            return json.loads(sections)
 
-    serialized_sections = json.dumps(sections)
-    r.set('sections', serialized_sections)
+    sections = catalog.compact(generate_course_json(semester, use_cache))
+    r.set('sections:compact', json.dumps(sections))
     return sections
 
 
 @shared_task(name='pca.tasks.update_course_json')
 def update_course_json():
-    generate_course_json(use_cache=False)
+    # rebuilds and caches both formats of the catalog
+    generate_compact_course_json(use_cache=False)
+
+
+def demand_score(pending, capacity, changes):
+    """
+    0-10 demand score for a section: grows with the number of students waiting per seat,
+    and with how often the section has opened and closed recently.
+    """
+    pressure = pending / max(capacity, 1) + settings.DEMAND_CHANGE_WEIGHT * changes
+    return round(10 * (1 - math.exp(-pressure)))
+
+
+@shared_task(name='pca.tasks.update_demand_scores')
+def update_demand_scores(semester=None):
+    """
+    Recompute every section's demand score in one aggregate query, save the ones which changed
+    in bulk, and rebuild the cached catalog so the typeahead shows them if it's the current semester's.
+    """
+    current = get_value('SEMESTER')
+    if semester is None:
+        semester = current
+
+    since = timezone.now() - timedelta(hours=settings.DEMAND_CHANGE_HOURS)
+    sections = Section.objects.filter(course__semester=semester) \
+        .only('id', 'capacity', 'demand', 'pending_registrations') \
+        .annotate(changes=Count('courseupdate', filter=Q(courseupdate__created_at__gte=since)))
+
+    changed = []
+    for section in sections:
+        demand = demand_score(section.pending_registrations, section.capacity, section.changes)
+        if demand != section.demand:
+            section.demand = demand
+            changed.append(section)
+    Section.objects.bulk_update(changed, ['demand'], batch_size=500)
+
+    # the cache only ever holds the current semester's catalog. It's rebuilt from the primary, since the
+    # replica may not have the new scores yet.
+    if semester == current:
+        with db.primary():
+            generate_compact_course_json(semester, use_cache=False)
+    return {'result': 'executed', 'name': 'pca.tasks.update_demand_scores', 'changed': len(changed)}
 
 
 @shared_task(name='pca.tasks.demo_alert')
@@ -58,15 +128,41 @@ def demo_task():
     return {'result': 'executed', 'name': 'pca.tasks.demo_task'}
 
 
+def apply_statuses(statuses):
+    """Set section statuses from a map of section id to status with one bulk_update. Returns the number changed."""
+    now = timezone.now()
+    changed = []
+    for section in Section.objects.filter(id__in=statuses.keys()).only('id', 'status'):
+        if section.status != statuses[section.id]:
+            section.status = statuses[section.id]
+            section.updated_at = now
+            changed.append(section)
+    Section.objects.bulk_update(changed, ['status', 'updated_at'])
+    return len(changed)
+
+
 @shared_task(name='pca.tasks.run_course_updates')
-def run_course_updates(semester=None):
+def run_course_updates(semester=None, batch_size=1000):
+    """
+    Replay course updates onto sections. Only the latest update of each section matters, so those are picked
+    out in the database with a single grouped subquery and streamed back in chunks, each applied in bulk.
+    """
     if semester is None:
         updates = CourseUpdate.objects.all()
     else:
         updates = CourseUpdate.objects.filter(section__course__semester=semester)
-    for u in updates:
-        update_course_from_record(u)
-    return {'result': 'executed', 'name': 'pca.tasks.run_course_updates'}
+    latest = updates.values('section_id').annotate(latest=Max('id')).values('latest')
+
+    changed = 0
+    statuses = {}
+    for section_id, status in CourseUpdate.objects.filter(id__in=Subquery(latest)) \
+            .values_list('section_id', 'new_status').iterator(chunk_size=batch_size):
+        statuses[section_id] = status
+        if len(statuses) >= batch_size:
+            changed += apply_statuses(statuses)
+            statuses = {}
+    changed += apply_statuses(statuses)
+    return {'result': 'executed', 'name': 'pca.tasks.run_course_updates', 'changed': changed}
 
 
 @shared_task(name='pca.tasks.load_courses')
@@ -83,23 +179,236 @@ def load_courses(query='', semester=None):
     return {'result': 'succeeded', 'name': 'pca.tasks.load_courses'}
 
 
-@shared_task(name='pca.tasks.send_alert')
-def send_alert(reg_id, sent_by=''):
-    result = Registration.objects.get(id=reg_id).alert(sent_by=sent_by)
+REGISTRATION_BUFFER_KEY = 'pca:registrations:buffer'
+REGISTRATION_FLUSH_LOCK = 'pca:registrations:flush'
+
+
+def buffer_registration(course_code, email_address, phone):
+    """
+    Validate a signup and queue it in redis to be inserted in bulk by `flush_registrations`,
+    instead of writing it right away. Duplicates are dropped at insert time by the dedup_key constraint.
+    """
+    error, registration = prepare_registration(course_code, email_address, phone)
+    if error is not None:
+        return error
+    r.rpush(REGISTRATION_BUFFER_KEY, json.dumps({
+        'section_id': registration.section_id,
+        'email': registration.email,
+        'phone': registration.phone,
+    }))
+    return RegStatus.SUCCESS
+
+
+@shared_task(name='pca.tasks.flush_registrations')
+def flush_registrations(batch_size=None):
+    """
+    Insert buffered registrations, one bulk_create per batch. A batch is only removed from the buffer once
+    it has been inserted, so a database error or a crash leaves it to be flushed again, and the lock keeps
+    two flushes from taking the same batch.
+    """
+    if batch_size is None:
+        batch_size = settings.REGISTRATION_BUFFER_BATCH
+
+    lock = r.lock(REGISTRATION_FLUSH_LOCK, timeout=settings.REGISTRATION_FLUSH_LOCK_TIMEOUT)
+    if not lock.acquire(blocking=False):
+        return {'result': 'skipped', 'name': 'pca.tasks.flush_registrations', 'flushed': 0}
+
+    inserted = 0
+    try:
+        while True:
+            batch = r.lrange(REGISTRATION_BUFFER_KEY, 0, batch_size - 1)
+            if len(batch) == 0:
+                break
+            inserted += insert_registrations([json.loads(item) for item in batch])
+            r.ltrim(REGISTRATION_BUFFER_KEY, len(batch), -1)
+            if len(batch) < batch_size:
+                break
+    finally:
+        lock.release()
+
+    return {'result': 'executed', 'name': 'pca.tasks.flush_registrations', 'flushed': inserted}
+
+
+def insert_registrations(items):
+    """
+    Insert buffered registrations with one bulk_create, skipping duplicates, and count the ones which were
+    inserted towards their sections' pending counters.
+    :return: the number of registrations inserted.
+    """
+    search_keys = section_search_keys({item['section_id'] for item in items})
+    # MySQL can't say which rows INSERT IGNORE skipped, so the inserted ones are tagged and read back
+    token = uuid.uuid4().hex
+    regs = []
+    for item in items:
+        if item['section_id'] not in search_keys:
+            continue  # the section was dropped since this was buffered
+        section_code, semester = search_keys[item['section_id']]
+        regs.append(Registration(section_id=item['section_id'],
+                                 email=item['email'],
+                                 phone=item['phone'],
+                                 dedup_key=pending_key(item['section_id'], item['email'], item['phone']),
+                                 section_code=section_code,
+                                 semester=semester,
+                                 claim_token=token))
+    with transaction.atomic():
+        Registration.objects.bulk_create(regs, ignore_conflicts=True)
+        counts = list(Registration.objects.filter(claim_token=token).values_list('section_id').annotate(n=Count('id')))
+        for section_id, count in counts:
+            adjust_pending_count(section_id, count)
+    return sum(count for _, count in counts)
+
+
+@shared_task(name='pca.tasks.send_alert', ignore_result=True, acks_late=True)
+def send_alert(reg_id, sent_by='', detected_at=None, enqueued_at=None, claimed=False):
+    """
+    :param detected_at: unix timestamp the section was seen opening, for latency metrics.
+    :param enqueued_at: unix timestamp this task was enqueued, for latency metrics.
+    :param claimed: whether the caller already claimed the registration with `claim_registrations`.
+        A claimed registration which already has deliveries was sent by an earlier run of this task,
+        and this is a redelivery of it (see acks_late), so it isn't sent again.
+    """
+    metrics.observe_since('alert_task_queue', enqueued_at)
+    if claimed:
+        unsent = Registration.objects.filter(id=reg_id, deliveries__isnull=True).exists()
+    else:
+        unsent = len(claim_registrations([reg_id], sent_by)) > 0
+    if not unsent:
+        return {
+            'result': False,
+            'task': 'pca.tasks.send_alert'
+        }
+    reg = Registration.objects.get(id=reg_id)
+    result = reg.send()
+    # measured once the alert is out, since the registration is marked sent when it's claimed, before queueing
+    metrics.observe_since('end_to_end', detected_at)
     return {
         'result': result,
         'task': 'pca.tasks.send_alert'
     }
 
 
-@shared_task(name='pca.tasks.update_course_info', rate_limit='100/m')
+def send_deliveries(deliveries):
+    """Make one round of attempts at `deliveries` with the async delivery engine, and save the outcomes."""
+    # imported here so the tasks don't need aiohttp and aiosmtplib until ASYNC_DELIVERY is turned on
+    from pca import delivery
+    with metrics.timed('render'):
+        messages = [delivery.delivery_message(tracked) for tracked in deliveries]
+    by_id = {tracked.id: tracked for tracked in deliveries}
+    for message, error, attempts in delivery.DeliveryEngine().send(messages):
+        by_id[message.key].record(error, attempts)
+    save_deliveries(deliveries)
+
+
+def attempt_deliveries(deliveries):
+    """
+    One round of attempts at `deliveries`: all at once with the async delivery engine with the ASYNC_DELIVERY
+    option on, or one after another otherwise.
+    """
+    if get_bool('ASYNC_DELIVERY', False):
+        send_deliveries(deliveries)
+    else:
+        for tracked in deliveries:
+            sender = Text if tracked.channel == Delivery.TEXT else Email
+            tracked.attempt(sender(tracked.registration).send_alert)
+        save_deliveries(deliveries)
+
+
+@shared_task(name='pca.tasks.send_section_alerts', ignore_result=True, acks_late=True)
+def send_section_alerts(reg_ids, detected_at=None, enqueued_at=None, job_id=None):
+    """
+    Send the alerts for registrations claimed with `claim_registrations` all at once, concurrently from this
+    worker with the async delivery engine (or one after another, for admin actions with ASYNC_DELIVERY off).
+    :param job_id: admin job to report progress to, see `pca.jobs`.
+    Registrations which already have deliveries were sent by an earlier run of a redelivered task,
+    and are skipped.
+    """
+    metrics.observe_since('alert_task_queue', enqueued_at)
+    regs = list(Registration.objects.filter(id__in=reg_ids, deliveries__isnull=True)
+                .select_related('section__course'))
+    deliveries = create_deliveries(regs)
+    attempt_deliveries(deliveries)
+    for reg in regs:
+        metrics.observe_since('end_to_end', detected_at)
+    statuses = [tracked.status for tracked in deliveries]
+    jobs.progress(job_id, done=len(regs),
+                  failed=len({tracked.registration_id for tracked in deliveries if tracked.status == Delivery.FAILED}))
+    return {
+        'result': all(status == Delivery.SENT for status in statuses),
+        'task': 'pca.tasks.send_section_alerts',
+        'sent': statuses.count(Delivery.SENT),
+        'retrying': statuses.count(Delivery.RETRYING),
+        'failed': statuses.count(Delivery.FAILED),
+    }
+
+
+@shared_task(name='pca.tasks.retry_deliveries', ignore_result=True, acks_late=True)
+def retry_deliveries(delivery_ids):
+    """
+    Retry deliveries which failed transiently, queued by `save_deliveries` with exponential backoff.
+    Runs separately from the alert fan-out, so slow or throttled providers don't hold it up.
+    """
+    deliveries = list(Delivery.objects.filter(id__in=delivery_ids, status=Delivery.RETRYING)
+                      .select_related('registration__section__course'))
+    attempt_deliveries(deliveries)
+
+
+def dispatch_alerts(reg_ids, sent_by='', detected_at=None):
+    """
+    Send the alerts for registrations claimed with `claim_registrations`: in one `send_section_alerts` task
+    with the ASYNC_DELIVERY option on, or one `send_alert` task each otherwise. If queueing fails, the
+    registrations which weren't queued are released with `release_registrations` before the error is raised.
+    """
+    if len(reg_ids) == 0:
+        return
+    queued = 0
+    try:
+        if get_bool('ASYNC_DELIVERY', False):
+            send_section_alerts.delay(reg_ids, detected_at=detected_at, enqueued_at=time.time())
+        else:
+            for reg_id in reg_ids:
+                send_alert.delay(reg_id, sent_by, detected_at=detected_at, enqueued_at=time.time(), claimed=True)
+                queued += 1
+    except Exception:
+        # nothing will send the alerts which couldn't be queued, so hand their claims back
+        release_registrations(reg_ids[queued:])
+        raise
+
+
+@shared_task(name='pca.tasks.resubscribe_registrations', ignore_result=True)
+def resubscribe_registrations(reg_ids, job_id=None):
+    """Resubscribe registrations in bulk, for the admin. See `Registration.resubscribe`."""
+    regs = list(Registration.objects.filter(id__in=reg_ids).select_related('section'))
+    for reg in regs:
+        reg.resubscribe()
+    jobs.progress(job_id, done=len(regs))
+
+
+@shared_task(name='pca.tasks.reload_sections', ignore_result=True)
+def reload_sections(courses, job_id=None):
+    """
+    Refresh sections from the registrar, with one (paged) request per course instead of one per section.
+    :param courses: list of (course code like CIS-120, semester, codes of the sections of it to reload).
+    :param job_id: admin job to report progress to, see `pca.jobs`.
+    """
+    for course_code, semester, section_codes in courses:
+        wanted = {separate_course_code('%s-%s' % (course_code, code)) for code in section_codes}
+        reloaded = 0
+        for info in api.get_courses(course_code, semester):
+            # the registrar pads department codes, like `CIS -160-001`
+            if separate_course_code(info['section_id_normalized']) in wanted:
+                upsert_course_from_opendata(info, semester)
+                reloaded += 1
+        jobs.progress(job_id, done=len(wanted), failed=len(wanted) - reloaded)
+
+
+@shared_task(name='pca.tasks.update_course_info', ignore_result=True)
 def update_course_info(section_code, semester):
-    data = api.get_course(section_code, semester, False)  # use the secondary api
+    data = api.get_course(section_code, semester)
     if data is not None:
         upsert_course_from_opendata(data, semester)
 
 
-@shared_task(name='pca.tasks.send_alerts_from_status')
+@shared_task(name='pca.tasks.send_alerts_from_status', ignore_result=True)
 def send_alerts_from_status(semester=None):
     if semester is None:
         semester = get_value('SEMESTER')
@@ -108,10 +417,10 @@ def send_alerts_from_status(semester=None):
         course_id = course['course_section']
         if course['status'] == 'O':
             try:
-                for reg in get_active_registrations(course_id, semester):
-                    send_alert.delay(reg.id, 'SERV')
-            except:
-                pass
+                dispatch_alerts(claim_section_registrations(course_id, semester, 'SERV'), 'SERV')
+            except Exception:
+                # one bad section (or a broker hiccup) shouldn't keep the rest from being alerted
+                logger.exception('could not send alerts for %s' % course_id)
 
 
 def should_send_alert(section_code, semester):
@@ -129,12 +438,21 @@ def should_send_alert(section_code, semester):
         return False
 
 
-# current API is rate-limited to 100/minute, so only spin off a single
-@shared_task(name='pca.tasks.send_alerts_for', rate_limit='100/m')
-def send_alerts_for(section_code, registrations, semester):
-    if should_send_alert(section_code, semester):
-        for reg_id in registrations:
-            send_alert.delay(reg_id)
+# current API is rate-limited to 100/minute. That budget is enforced across all workers by the token
+# bucket in `api.throttle`, so no per-worker celery rate_limit is needed here.
+@shared_task(name='pca.tasks.send_alerts_for', ignore_result=True)
+def send_alerts_for(section_code, registrations, semester, changes=None):
+    """
+    :param changes: the section's recent status changes, when it is polled on an adaptive schedule.
+        Its next poll is scheduled once this one is done.
+    """
+    should_send = should_send_alert(section_code, semester)
+    scheduling.record_poll(semester, section_code)
+    if changes is not None:
+        scheduling.schedule_poll(semester, section_code, changes)
+    if should_send:
+        detected_at = time.time()
+        dispatch_alerts(claim_registrations(registrations), detected_at=detected_at)
 
 
 def get_active_registrations(course_code, semester):
@@ -142,33 +460,63 @@ def get_active_registrations(course_code, semester):
     return list(section.registration_set.filter(notification_sent=False))
 
 
-@shared_task(name='pca.tasks.send_course_alerts')
-def send_course_alerts(course_code, semester=None, sent_by=''):
+def claim_section_registrations(course_code, semester, sent_by=''):
+    """Claim every registration waiting on an alert for a section at once. See `claim_registrations`."""
+    return claim_registrations([reg.id for reg in get_active_registrations(course_code, semester)], sent_by)
+
+
+@shared_task(name='pca.tasks.send_course_alerts', ignore_result=True, acks_late=True)
+def send_course_alerts(course_code, semester=None, sent_by='', detected_at=None):
+    """:param detected_at: unix timestamp the section was seen opening, for latency metrics."""
+    metrics.observe_since('course_task_queue', detected_at)
     if semester is None:
         semester = get_value('SEMESTER')
 
-    for reg in get_active_registrations(course_code, semester):
-        send_alert.delay(reg.id, sent_by)
+    dispatch_alerts(claim_section_registrations(course_code, semester, sent_by), sent_by, detected_at)
 
 
 def collect_registrations(semester):
     alerts = {}
-    for reg in Registration.objects.filter(section__course__semester=semester, notification_sent=False):
+    regs = Registration.objects.filter(section__course__semester=semester, notification_sent=False) \
+        .values_list('id', 'section__course__department', 'section__course__code', 'section__code')
+    for reg_id, dept, course, section in regs:
         # Group registrations into buckets based on their associated section
-        sect = reg.section.normalized
+        sect = '%s-%s-%s' % (dept, course, section)
         if sect in alerts:
-            alerts[sect].append(reg.id)
+            alerts[sect].append(reg_id)
         else:
-            alerts[sect] = [reg.id]
+            alerts[sect] = [reg_id]
     return alerts
 
 
-@shared_task(name='pca.tasks.prepare_alerts')
-def prepare_alerts(semester=None):
+@shared_task(name='pca.tasks.prepare_alerts', ignore_result=True)
+def prepare_alerts(semester=None, limit=None):
+    """
+    Poll every section with pending registrations, most urgent first. The most urgent sections go on
+    their own queue so they don't wait behind the rest. Pass `limit` to only poll the top sections,
+    which lets a more frequent schedule re-poll the sections where latency matters most.
+
+    With the ADAPTIVE_POLLING option on, only sections which are due are polled, and once its poll is done
+    each section is scheduled again after an interval learned from how often its status has changed recently.
+    """
     if semester is None:
         semester = get_value('SEMESTER')
 
-    for section_code, registrations in collect_registrations(semester).items():
-        send_alerts_for.delay(section_code, registrations, semester)
+    adaptive = get_bool('ADAPTIVE_POLLING', False)
+    alerts = collect_registrations(semester)
+    if adaptive:
+        alerts = scheduling.due_sections(semester, alerts)
+
+    volatility = scheduling.get_volatility(semester)
+    ranked = scheduling.rank_sections(semester, alerts, volatility)
+    if limit is not None:
+        ranked = ranked[:limit]
+    if adaptive:
+        scheduling.lease_polls(semester, ranked)
+
+    for i, section_code in enumerate(ranked):
+        queue = 'polls_priority' if i < settings.POLL_PRIORITY_SECTIONS else 'polls'
+        changes = volatility.get(section_code, 0) if adaptive else None
+        send_alerts_for.apply_async((section_code, alerts[section_code], semester, changes), queue=queue)
 
     return {'task': 'pca.tasks.prepare_alerts', 'result': 'complete'}
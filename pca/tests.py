@@ -1,11 +1,22 @@
 import json
+import time
+import asyncio
 import base64
 from unittest.mock import Mock, patch
 
-from django.test import TestCase, Client
+import redis
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.db import DatabaseError
+from django.test import TestCase, Client, override_settings
+from django.core.paginator import Paginator
 from django.urls import reverse
 
-from pca import tasks
+from pca import tasks, api, ratelimit, credentials, scheduling, metrics, search, catalog, archive, audit, delivery, \
+    fakes, db, pagination, jobs
+from pca.admin import RegistrationAdmin, SectionAdmin
 from pca.models import *
 from options.models import *
 
@@ -212,6 +223,16 @@ class RegisterTestCase(TestCase):
         self.assertEqual(RegStatus.NO_CONTACT_INFO, res)
         self.assertEqual(0, len(Registration.objects.all()))
 
+    def test_unknown_course(self):
+        res = register_for_course('CIS-999-001', 'e@example.com', None)
+        self.assertEqual(RegStatus.COURSE_NOT_FOUND, res)
+        self.assertEqual(0, len(Registration.objects.all()))
+        self.assertEqual(2, Course.objects.count())
+
+    def test_unparseable_course(self):
+        res = register_for_course('BLAH BLAH', 'e@example.com', None)
+        self.assertEqual(RegStatus.COURSE_NOT_FOUND, res)
+
 
 class ResubscribeTestCase(TestCase):
     def setUp(self):
@@ -279,6 +300,30 @@ class ResubscribeTestCase(TestCase):
         self.assertEqual(4, len(Registration.objects.all()))
         self.assertEqual(result, reg3)
 
+    def test_chain_root(self):
+        self.base_reg.notification_sent = True
+        self.base_reg.save()
+        reg1 = self.base_reg.resubscribe()
+        reg1.notification_sent = True
+        reg1.save()
+        reg2 = reg1.resubscribe()
+        self.assertIsNone(self.base_reg.resubscription_root)
+        self.assertEqual(self.base_reg, reg1.resubscription_root)
+        self.assertEqual(self.base_reg, reg2.resubscription_root)
+        self.assertEqual(reg2, self.base_reg.latest_in_chain())
+        self.assertEqual(reg2, reg1.latest_in_chain())
+
+    def test_resubscribe_view(self):
+        self.base_reg.notification_sent = True
+        self.base_reg.save()
+        res = Client().get(reverse('resubscribe', kwargs={'id_': self.base_reg.id}))
+        self.assertEqual(200, res.status_code)
+        self.assertEqual(2, Registration.objects.count())
+
+    def test_resubscribe_view_not_found(self):
+        res = Client().get(reverse('resubscribe', kwargs={'id_': self.base_reg.id + 1}))
+        self.assertEqual(404, res.status_code)
+
 
 class WebhookTriggeredAlertTestCase(TestCase):
     def setUp(self):
@@ -563,3 +608,1119 @@ class CourseStatusUpdateTestCase(TestCase):
         update_course_from_record(up)
         _, section = get_course_and_section(self.section.normalized, TEST_SEMESTER)
         self.assertEqual('O', section.status)
+
+
+@patch('pca.ratelimit.time.sleep')
+class TokenBucketTestCase(TestCase):
+    def setUp(self):
+        self.bucket = ratelimit.TokenBucket('test', 100)
+
+    def test_acquire_immediately(self, mock_sleep):
+        with patch.object(self.bucket, 'try_acquire', return_value=0):
+            self.bucket.acquire()
+        self.assertFalse(mock_sleep.called)
+
+    def test_acquire_waits(self, mock_sleep):
+        with patch.object(self.bucket, 'try_acquire', side_effect=[0.5, 0]):
+            self.bucket.acquire(timeout=10)
+        mock_sleep.assert_called_once_with(0.5)
+
+    def test_acquire_timeout(self, mock_sleep):
+        with patch.object(self.bucket, 'try_acquire', return_value=60):
+            with self.assertRaises(ratelimit.RateLimitExceeded):
+                self.bucket.acquire(timeout=10)
+        self.assertFalse(mock_sleep.called)
+
+    @patch('pca.api.requests.get')
+    def test_throttled_api_request(self, mock_get, mock_sleep):
+        with patch('pca.api.throttle', side_effect=ratelimit.RateLimitExceeded('throttled')):
+            data, err = api.make_api_request({}, api.get_headers())
+        self.assertIsNone(data)
+        self.assertEqual('throttled', err)
+        self.assertFalse(mock_get.called)
+
+    def test_script_burst(self, mock_sleep):
+        bucket = ratelimit.TokenBucket('test-burst', 60, period=60, burst=3)
+        ratelimit.r.delete(bucket.key)
+        self.assertEqual([0, 0, 0], [bucket.try_acquire() for _ in range(3)])
+        self.assertAlmostEqual(1, bucket.try_acquire(), delta=0.1)
+
+    @patch('pca.ratelimit.time.time', return_value=2e9)
+    def test_script_uses_server_time(self, mock_time, mock_sleep):
+        bucket = ratelimit.TokenBucket('test-clock', 60, period=60, burst=1)
+        ratelimit.r.delete(bucket.key)
+        self.assertEqual(0, bucket.try_acquire())
+        # a worker whose clock runs far ahead doesn't get a refilled bucket
+        self.assertGreater(bucket.try_acquire(), 0)
+
+
+@patch('pca.api.get_bucket')
+@patch('pca.api.requests.get')
+class CredentialPoolTestCase(TestCase):
+    def setUp(self):
+        self.keys = [credentials.Credential('key1', 'secret1'), credentials.Credential('key2', 'secret2')]
+        self.pool = credentials.CredentialPool(self.keys)
+        patcher = patch('pca.api.pool', self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pool.record = Mock()
+        self.pool.cooldown = Mock()
+
+    def response(self, status_code):
+        return Mock(status_code=status_code, text='error', json=Mock(return_value={'result_data': []}))
+
+    def test_rotate_on_throttle(self, mock_get, mock_bucket):
+        self.pool.select = Mock(side_effect=self.keys)
+        mock_get.side_effect = [self.response(429), self.response(200)]
+        data, err = api.make_api_request({})
+        self.assertIsNone(err)
+        self.assertEqual(2, mock_get.call_count)
+        self.assertEqual('key2', mock_get.call_args[1]['headers']['Authorization-Bearer'])
+        self.assertEqual(self.keys[0], self.pool.cooldown.call_args[0][0])
+
+    def test_all_keys_rejected(self, mock_get, mock_bucket):
+        self.pool.select = Mock(side_effect=self.keys)
+        mock_get.return_value = self.response(401)
+        data, err = api.make_api_request({})
+        self.assertIsNone(data)
+        self.assertEqual(2, self.pool.cooldown.call_count)
+
+    def test_other_error_not_retried(self, mock_get, mock_bucket):
+        self.pool.select = Mock(side_effect=self.keys)
+        mock_get.return_value = self.response(500)
+        data, err = api.make_api_request({})
+        self.assertIsNone(data)
+        self.assertEqual(1, mock_get.call_count)
+        self.assertFalse(self.pool.cooldown.called)
+
+
+@patch('pca.scheduling.get_last_polls')
+class PollPriorityTestCase(TestCase):
+    def setUp(self):
+        self.sections = []
+        self.sections.append(get_course_and_section('CIS-160-001', TEST_SEMESTER)[1])
+        self.sections.append(get_course_and_section('CIS-160-002', TEST_SEMESTER)[1])
+        self.sections.append(get_course_and_section('CIS-120-001', TEST_SEMESTER)[1])
+
+    def register(self, section, n):
+        for i in range(n):
+            Registration(email='%d@example.com' % i, section=section).save()
+
+    def test_more_demand_first(self, mock_polls):
+        mock_polls.return_value = {}
+        self.register(self.sections[0], 1)
+        self.register(self.sections[1], 5)
+        self.register(self.sections[2], 3)
+        ranked = scheduling.rank_sections(TEST_SEMESTER, tasks.collect_registrations(TEST_SEMESTER))
+        self.assertEqual([self.sections[1].normalized, self.sections[2].normalized, self.sections[0].normalized],
+                         ranked)
+
+    def test_volatile_first(self, mock_polls):
+        mock_polls.return_value = {}
+        self.register(self.sections[0], 2)
+        self.register(self.sections[1], 2)
+        record_update(self.sections[1].normalized, TEST_SEMESTER, 'C', 'O', False, '')
+        record_update(self.sections[1].normalized, TEST_SEMESTER, 'O', 'C', False, '')
+        ranked = scheduling.rank_sections(TEST_SEMESTER, tasks.collect_registrations(TEST_SEMESTER))
+        self.assertEqual(self.sections[1].normalized, ranked[0])
+
+    def test_volatility_counts_status_changes(self, mock_polls):
+        record_update(self.sections[0].normalized, TEST_SEMESTER, 'C', 'C', False, '')
+        record_update(self.sections[0].normalized, TEST_SEMESTER, 'C', 'O', False, '')
+        self.assertEqual({self.sections[0].normalized: 1}, scheduling.get_volatility(TEST_SEMESTER))
+
+    def test_stale_first(self, mock_polls):
+        self.register(self.sections[0], 2)
+        self.register(self.sections[1], 2)
+        mock_polls.return_value = {self.sections[0].normalized: time.time()}
+        ranked = scheduling.rank_sections(TEST_SEMESTER, tasks.collect_registrations(TEST_SEMESTER))
+        self.assertEqual(self.sections[1].normalized, ranked[0])
+
+
+class LastPollTestCase(TestCase):
+    def setUp(self):
+        scheduling.r.delete(scheduling.last_poll_key(TEST_SEMESTER), scheduling.last_poll_key('2018C'))
+
+    def test_per_semester(self):
+        scheduling.record_poll(TEST_SEMESTER, 'CIS-120-001')
+        self.assertIn('CIS-120-001', scheduling.get_last_polls(TEST_SEMESTER, ['CIS-120-001']))
+        self.assertEqual({}, scheduling.get_last_polls('2018C', ['CIS-120-001']))
+
+    def test_expires(self):
+        scheduling.record_poll(TEST_SEMESTER, 'CIS-120-001')
+        ttl = scheduling.r.ttl(scheduling.last_poll_key(TEST_SEMESTER))
+        self.assertTrue(0 < ttl <= settings.POLL_STALENESS_CAP)
+
+
+class PollIntervalTestCase(TestCase):
+    def test_stable_section(self):
+        self.assertEqual(settings.POLL_INTERVAL_MAX, scheduling.poll_interval(0))
+
+    def test_flapping_section(self):
+        self.assertEqual(settings.POLL_INTERVAL_MIN, scheduling.poll_interval(1000))
+
+    def test_more_changes_polled_sooner(self):
+        self.assertLess(scheduling.poll_interval(4), scheduling.poll_interval(1))
+
+
+@patch('pca.tasks.send_alerts_for.apply_async')
+class AdaptivePollingTestCase(TestCase):
+    def setUp(self):
+        Option.objects.update_or_create(key='ADAPTIVE_POLLING', value_type='BOOL', defaults={'value': 'TRUE'})
+        scheduling.r.delete(scheduling.due_key(TEST_SEMESTER))
+        self.cis120 = get_course_and_section('CIS-120-001', TEST_SEMESTER)[1]
+        self.cis121 = get_course_and_section('CIS-121-001', TEST_SEMESTER)[1]
+        Registration(email='a@example.com', section=self.cis120).save()
+        Registration(email='b@example.com', section=self.cis121).save()
+
+    def dispatched(self, mock_dispatch):
+        sections = sorted(call[0][0][0] for call in mock_dispatch.call_args_list)
+        mock_dispatch.reset_mock()
+        return sections
+
+    def due_at(self, section):
+        return scheduling.r.zscore(scheduling.due_key(TEST_SEMESTER), section.normalized)
+
+    def test_new_sections_due(self, mock_dispatch):
+        tasks.prepare_alerts(TEST_SEMESTER)
+        self.assertEqual(['CIS-120-001', 'CIS-121-001'], self.dispatched(mock_dispatch))
+
+    def test_not_redispatched_while_polling(self, mock_dispatch):
+        tasks.prepare_alerts(TEST_SEMESTER)
+        self.dispatched(mock_dispatch)
+        self.assertAlmostEqual(time.time() + settings.POLL_LEASE, self.due_at(self.cis120), delta=5)
+        tasks.prepare_alerts(TEST_SEMESTER)
+        self.assertEqual([], self.dispatched(mock_dispatch))
+
+    @patch('pca.tasks.should_send_alert', return_value=False)
+    def test_scheduled_when_poll_completes(self, mock_should_send, mock_dispatch):
+        tasks.prepare_alerts(TEST_SEMESTER)
+        section_code, regs, semester, changes = mock_dispatch.call_args_list[0][0][0]
+        self.assertEqual(0, changes)
+        tasks.send_alerts_for(section_code, regs, semester, changes)
+        _, section = get_course_and_section(section_code, TEST_SEMESTER)
+        self.assertAlmostEqual(time.time() + settings.POLL_INTERVAL_MAX, self.due_at(section), delta=5)
+
+    def test_due_again(self, mock_dispatch):
+        scheduling.r.zadd(scheduling.due_key(TEST_SEMESTER), {'CIS-120-001': time.time() - 1,
+                                                              'CIS-121-001': time.time() + 60})
+        tasks.prepare_alerts(TEST_SEMESTER)
+        self.assertEqual(['CIS-120-001'], self.dispatched(mock_dispatch))
+
+    def test_drop_sections_without_registrations(self, mock_dispatch):
+        Registration.objects.filter(section=self.cis121).update(notification_sent=True)
+        scheduling.r.zadd(scheduling.due_key(TEST_SEMESTER), {'CIS-121-001': 0})
+        tasks.prepare_alerts(TEST_SEMESTER)
+        self.assertEqual(['CIS-120-001'], self.dispatched(mock_dispatch))
+        self.assertIsNone(self.due_at(self.cis121))
+
+
+class LatencyPercentileTestCase(TestCase):
+    def counts(self, values):
+        counts = [0] * len(metrics.BUCKETS)
+        for bound, count in values.items():
+            counts[metrics.BUCKETS.index(bound)] = count
+        return counts
+
+    def test_empty(self):
+        self.assertIsNone(metrics.percentile(self.counts({}), 0.5))
+
+    def test_percentiles(self):
+        counts = self.counts({0.1: 50, 1: 45, 10: 4, 60: 1})
+        self.assertEqual(0.1, metrics.percentile(counts, 0.5))
+        self.assertEqual(1, metrics.percentile(counts, 0.95))
+        self.assertEqual(10, metrics.percentile(counts, 0.99))
+        self.assertEqual(60, metrics.percentile(counts, 1))
+
+    def test_overflow(self):
+        counts = self.counts({1: 90, float('inf'): 10})
+        self.assertEqual(1, metrics.percentile(counts, 0.5))
+        self.assertEqual('>3600', metrics.percentile(counts, 0.95))
+
+    def test_overflow_view(self):
+        metrics.reset()
+        metrics.observe('end_to_end', 5000)
+        client = Client()
+        client.force_login(User.objects.create_user('staff', is_staff=True))
+        response = client.get(reverse('alert-latency'))
+        summary = json.loads(response.content, parse_constant=lambda constant: self.fail('not JSON: ' + constant))
+        self.assertEqual('>3600', summary['end_to_end']['p99'])
+        self.assertEqual(1, summary['end_to_end']['buckets']['>3600'])
+        metrics.reset()
+
+
+class SearchIndexTestCase(TestCase):
+    def setUp(self):
+        def section(section_id, title, instructors):
+            return {'section_id': section_id, 'course_title': title, 'instructors': instructors, 'meeting_days': []}
+
+        self.index = search.SearchIndex([
+            section('CIS-120-001', 'Programming Languages and Techniques I', ['Stephanie Weirich']),
+            section('CIS-120-002', 'Programming Languages and Techniques I', ['Stephanie Weirich']),
+            section('CIS-121-001', 'Programming Languages and Techniques II', ['Rajiv Gandhi']),
+            section('MATH-114-001', 'Calculus II', ['Stephanie Rossi']),
+        ])
+
+    def assertResults(self, query, expected):
+        self.assertEqual(expected, [s['section_id'] for s in self.index.search(query)])
+
+    def test_department(self):
+        self.assertResults('cis', ['CIS-120-001', 'CIS-120-002', 'CIS-121-001'])
+
+    def test_course_code_formats(self):
+        for query in ['CIS120', 'cis-120', 'cis 120']:
+            self.assertResults(query, ['CIS-120-001', 'CIS-120-002'])
+
+    def test_full_section_code(self):
+        self.assertResults('CIS120002', ['CIS-120-002'])
+
+    def test_code_prefix(self):
+        self.assertResults('cis 12', ['CIS-120-001', 'CIS-120-002', 'CIS-121-001'])
+
+    def test_title_and_instructor(self):
+        self.assertResults('stephanie', ['CIS-120-001', 'CIS-120-002', 'MATH-114-001'])
+        self.assertResults('calc', ['MATH-114-001'])
+        self.assertResults('steph prog', ['CIS-120-001', 'CIS-120-002'])
+
+    def test_limit(self):
+        self.assertEqual(1, len(self.index.search('cis', limit=1)))
+
+    def test_no_match(self):
+        self.assertResults('phys', [])
+        self.assertResults('', [])
+
+    def test_bad_limit(self):
+        for limit in ['0', '-5', 'ten']:
+            response = Client().get(reverse('courses-search'), {'q': 'cis', 'limit': limit})
+            self.assertEqual(400, response.status_code)
+
+
+class CompactCatalogTestCase(TestCase):
+    def setUp(self):
+        self.sections = [
+            {'section_id': 'CIS-120-001', 'course_title': 'Programming Languages and Techniques I',
+             'instructors': ['Stephanie Weirich', 'Swapneel Sheth'], 'meeting_days': ['MWF 12:00 PM - 01:00 PM']},
+            {'section_id': 'CIS-120-201', 'course_title': 'Programming Languages and Techniques I',
+             'instructors': ['Stephanie Weirich'], 'meeting_days': []},
+            {'section_id': 'MATH-114-001', 'course_title': 'Calculus II',
+             'instructors': [], 'meeting_days': ['MWF 12:00 PM - 01:00 PM']},
+        ]
+
+    def test_round_trip(self):
+        self.assertEqual(self.sections, catalog.expand(catalog.compact(self.sections)))
+
+    def test_dedup(self):
+        result = catalog.compact(self.sections)
+        self.assertEqual(['CIS-120', 'MATH-114'], result['courses']['course_id'])
+        self.assertEqual(2, len(result['courses']['title']))
+        self.assertEqual(['Stephanie Weirich', 'Swapneel Sheth'], result['instructors'])
+        self.assertEqual(1, len(result['meetings']))
+        self.assertEqual([0, 0, 1], result['sections']['course'])
+
+    def test_extra_fields(self):
+        for i, section in enumerate(self.sections):
+            section['demand'] = i
+        result = catalog.compact(self.sections)
+        self.assertEqual([0, 1, 2], result['sections']['demand'])
+        self.assertEqual(self.sections, catalog.expand(result))
+
+    @patch('pca.views.generate_compact_course_json')
+    @patch('pca.views.generate_course_json')
+    def test_varies_on_accept(self, mock_sections, mock_compact):
+        mock_sections.return_value = self.sections
+        mock_compact.return_value = catalog.compact(self.sections)
+        for accept in ['application/json', catalog.COMPACT_CONTENT_TYPE]:
+            response = Client().get(reverse('courses'), HTTP_ACCEPT=accept)
+            self.assertIn('Accept', response['Vary'])
+        self.assertEqual(catalog.COMPACT_CONTENT_TYPE, response['Content-Type'])
+
+
+@patch('pca.tasks.generate_compact_course_json')
+class DemandScoreTestCase(TestCase):
+    def setUp(self):
+        Option.objects.update_or_create(key='SEMESTER', value_type='TXT', defaults={'value': TEST_SEMESTER})
+        _, self.section = get_course_and_section('CIS-120-001', TEST_SEMESTER)
+        self.section.capacity = 10
+        self.section.save()
+        _, self.other = get_course_and_section('CIS-120-002', TEST_SEMESTER)
+
+    def test_score_bounds(self, mock_catalog):
+        self.assertEqual(0, tasks.demand_score(0, 10, 0))
+        self.assertEqual(10, tasks.demand_score(100, 10, 50))
+        self.assertLess(tasks.demand_score(2, 10, 0), tasks.demand_score(8, 10, 0))
+        self.assertLess(tasks.demand_score(2, 10, 0), tasks.demand_score(2, 10, 5))
+
+    def test_update_scores(self, mock_catalog):
+        for i in range(10):
+            Registration(email='%d@example.com' % i, section=self.section).save()
+        Registration(email='sent@example.com', section=self.other, notification_sent=True).save()
+        record_update(self.section.normalized, TEST_SEMESTER, 'C', 'O', False, '')
+
+        result = tasks.update_demand_scores(TEST_SEMESTER)
+        self.assertEqual(1, result['changed'])
+        self.assertEqual(tasks.demand_score(10, 10, 1), Section.objects.get(id=self.section.id).demand)
+        self.assertEqual(0, Section.objects.get(id=self.other.id).demand)
+        self.assertTrue(mock_catalog.called)
+
+    def test_past_semester_not_cached(self, mock_catalog):
+        get_course_and_section('CIS-120-001', '2018C')
+        tasks.update_demand_scores('2018C')
+        self.assertFalse(mock_catalog.called)
+
+    def test_catalog_rebuilt_from_primary(self, mock_catalog):
+        reads = []
+
+        def rebuild(*args, **kwargs):
+            # like `build_course_json`, which reads the catalog inside a replica block
+            with db.replica():
+                reads.append(db.ReplicaRouter().db_for_read(Section))
+        mock_catalog.side_effect = rebuild
+        with self.settings(DATABASES=dict(settings.DATABASES, replica=settings.DATABASES['default'])):
+            tasks.update_demand_scores(TEST_SEMESTER)
+        self.assertEqual(['default'], reads)
+
+
+@patch('pca.models.Text.send_alert')
+@patch('pca.models.Email.send_alert')
+class PendingCountTestCase(TestCase):
+    def setUp(self):
+        _, self.section = get_course_and_section('CIS-120-001', TEST_SEMESTER)
+
+    def pending(self):
+        return Section.objects.get(id=self.section.id).pending_registrations
+
+    def test_register(self, mock_email, mock_text):
+        register_for_course(self.section.normalized, 'e@example.com', None)
+        register_for_course(self.section.normalized, 'f@example.com', None)
+        self.assertEqual(2, self.pending())
+
+    def test_duplicate_not_counted(self, mock_email, mock_text):
+        register_for_course(self.section.normalized, 'e@example.com', None)
+        register_for_course(self.section.normalized, 'e@example.com', None)
+        self.assertEqual(1, self.pending())
+
+    def test_alert(self, mock_email, mock_text):
+        reg = Registration(email='e@example.com', section=self.section)
+        reg.save()
+        reg.alert()
+        self.assertEqual(0, self.pending())
+        reg.alert(forced=True)
+        self.assertEqual(0, self.pending())
+
+    def test_resubscribe(self, mock_email, mock_text):
+        reg = Registration(email='e@example.com', section=self.section)
+        reg.save()
+        reg.alert()
+        reg.resubscribe()
+        reg.resubscribe()
+        self.assertEqual(1, self.pending())
+
+    def test_reconcile(self, mock_email, mock_text):
+        Registration(email='e@example.com', section=self.section).save()
+        Registration(email='f@example.com', section=self.section).save()
+        Section.objects.filter(id=self.section.id).update(pending_registrations=5)
+        drift = reconcile_pending_counts()
+        self.assertEqual([(self.section.id, 5, 2)], drift)
+        self.assertEqual(2, self.pending())
+        self.assertEqual([], reconcile_pending_counts())
+
+    def test_delete(self, mock_email, mock_text):
+        Registration(email='e@example.com', section=self.section).save()
+        Registration(email='f@example.com', section=self.section, notification_sent=True).save()
+        Registration.objects.all().delete()
+        self.assertEqual(0, self.pending())
+
+    def test_admin_edit(self, mock_email, mock_text):
+        _, other = get_course_and_section('CIS-120-002', TEST_SEMESTER)
+        reg = Registration(email='e@example.com', section=self.section)
+        reg.save()
+        registration_admin = RegistrationAdmin(Registration, admin.site)
+        reg.section = other
+        registration_admin.save_model(None, reg, None, True)
+        self.assertEqual((0, 1), (self.pending(), Section.objects.get(id=other.id).pending_registrations))
+        reg.notification_sent = True
+        registration_admin.save_model(None, reg, None, True)
+        self.assertEqual(0, Section.objects.get(id=other.id).pending_registrations)
+
+
+class BufferedRegistrationTestCase(TestCase):
+    def setUp(self):
+        _, self.section = get_course_and_section('CIS-120-001', TEST_SEMESTER)
+        tasks.r.delete(tasks.REGISTRATION_BUFFER_KEY, tasks.REGISTRATION_FLUSH_LOCK)
+
+    @property
+    def buffer(self):
+        return tasks.r.lrange(tasks.REGISTRATION_BUFFER_KEY, 0, -1)
+
+    def test_flush(self):
+        tasks.buffer_registration(self.section.normalized, 'e@example.com', '5555555555')
+        tasks.buffer_registration(self.section.normalized, 'f@example.com', None)
+        self.assertEqual(0, Registration.objects.count())
+        tasks.flush_registrations()
+        self.assertEqual(2, Registration.objects.count())
+        self.assertEqual('+15555555555', Registration.objects.get(email='e@example.com').phone)
+        self.assertEqual(2, Section.objects.get(id=self.section.id).pending_registrations)
+
+    def test_flush_duplicates(self):
+        Registration(email='e@example.com', section=self.section).save()
+        tasks.buffer_registration(self.section.normalized, 'e@example.com', None)
+        tasks.buffer_registration(self.section.normalized, 'e@example.com', None)
+        self.assertEqual(0, tasks.flush_registrations()['flushed'])
+        self.assertEqual(1, Registration.objects.count())
+        self.assertEqual(1, Section.objects.get(id=self.section.id).pending_registrations)
+
+    def test_failed_insert_kept(self):
+        tasks.buffer_registration(self.section.normalized, 'e@example.com', None)
+        with patch('pca.tasks.Registration.objects.bulk_create', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                tasks.flush_registrations()
+        self.assertEqual(1, len(self.buffer))
+        self.assertEqual(1, tasks.flush_registrations()['flushed'])
+        self.assertEqual([], self.buffer)
+
+    def test_batches(self):
+        for i in range(5):
+            tasks.buffer_registration(self.section.normalized, '%d@example.com' % i, None)
+        self.assertEqual(5, tasks.flush_registrations(batch_size=2)['flushed'])
+        self.assertEqual(5, Section.objects.get(id=self.section.id).pending_registrations)
+        self.assertEqual([], self.buffer)
+
+    def test_unknown_course(self):
+        res = tasks.buffer_registration('CIS-999-001', 'e@example.com', None)
+        self.assertEqual(RegStatus.COURSE_NOT_FOUND, res)
+        self.assertEqual([], self.buffer)
+
+
+class BulkRegisterTestCase(TestCase):
+    def setUp(self):
+        self.sections = []
+        self.sections.append(get_course_and_section('CIS-120-001', TEST_SEMESTER)[1])
+        self.sections.append(get_course_and_section('CIS-120-002', TEST_SEMESTER)[1])
+        self.sections.append(get_course_and_section('CIS-121-001', TEST_SEMESTER)[1])
+
+    def test_register_all(self):
+        codes = [s.normalized for s in self.sections]
+        results = register_for_sections(codes, 'e@example.com', '5555555555')
+        self.assertEqual({code: RegStatus.SUCCESS for code in codes}, results)
+        self.assertEqual(3, Registration.objects.filter(phone='+15555555555').count())
+        for section in self.sections:
+            self.assertEqual(1, Section.objects.get(id=section.id).pending_registrations)
+
+    def test_mixed_results(self):
+        Registration(email='e@example.com', section=self.sections[0]).save()
+        results = register_for_sections(['CIS-120-001', 'CIS120002', 'CIS-120-002', 'CIS-999-001', 'BLAH'],
+                                        'e@example.com', None)
+        self.assertEqual({
+            'CIS-120-001': RegStatus.OPEN_REG_EXISTS,
+            'CIS120002': RegStatus.SUCCESS,
+            'CIS-120-002': RegStatus.SUCCESS,
+            'CIS-999-001': RegStatus.COURSE_NOT_FOUND,
+            'BLAH': RegStatus.COURSE_NOT_FOUND,
+        }, results)
+        self.assertEqual(2, Registration.objects.count())
+
+    def test_listed_twice(self):
+        results = register_for_sections(['CIS-120-001', 'CIS-120-001'], 'e@example.com', None)
+        self.assertEqual({'CIS-120-001': RegStatus.SUCCESS}, results)
+        self.assertEqual(1, Registration.objects.count())
+        self.assertEqual(1, Section.objects.get(id=self.sections[0].id).pending_registrations)
+
+    def test_no_contact(self):
+        results = register_for_sections(['CIS-120-001'], None, 'not a phone number')
+        self.assertEqual({'CIS-120-001': RegStatus.NO_CONTACT_INFO}, results)
+        self.assertEqual(0, Registration.objects.count())
+
+    def test_view(self):
+        res = Client().post(reverse('register-bulk'),
+                            data=json.dumps({'sections': ['CIS-120-001', 'CIS-999-001'], 'email': 'e@example.com'}),
+                            content_type='application/json')
+        self.assertEqual(200, res.status_code)
+        self.assertEqual({'CIS-120-001': 'SUCCESS', 'CIS-999-001': 'COURSE_NOT_FOUND'},
+                         json.loads(res.content)['results'])
+
+    def test_view_bad_request(self):
+        for body in [{'email': 'e@example.com'}, ['CIS-120-001'], {'sections': [120], 'email': 'e@example.com'}]:
+            res = Client().post(reverse('register-bulk'), data=json.dumps(body), content_type='application/json')
+            self.assertEqual(400, res.status_code)
+
+
+@patch('pca.models.normalize_phone', wraps=normalize_phone)
+class PhoneNormalizationTestCase(TestCase):
+    def setUp(self):
+        _, self.section = get_course_and_section('CIS-120-001', TEST_SEMESTER)
+
+    def test_normalized_on_create(self, mock_normalize):
+        reg = Registration(section=self.section, phone='(215) 555-5555')
+        reg.save()
+        self.assertEqual('+12155555555', reg.phone)
+        self.assertTrue(mock_normalize.called)
+
+    def test_not_normalized_when_unchanged(self, mock_normalize):
+        Registration(section=self.section, phone='2155555555').save()
+        reg = Registration.objects.get()
+        mock_normalize.reset_mock()
+        reg.notification_sent = True
+        reg.save()
+        self.assertFalse(mock_normalize.called)
+
+    def test_normalized_when_changed(self, mock_normalize):
+        Registration(section=self.section, phone='2155555555').save()
+        reg = Registration.objects.get()
+        reg.phone = '215 555 5556'
+        reg.save()
+        self.assertEqual('+12155555556', Registration.objects.get().phone)
+
+    def test_bulk_normalize(self, mock_normalize):
+        Registration(section=self.section, phone='2155555555').save()
+        Registration.objects.update(phone='215-555-5555')
+        self.assertEqual(1, normalize_phones(Registration.objects.all()))
+        self.assertEqual('+12155555555', Registration.objects.get().phone)
+        self.assertEqual(0, normalize_phones(Registration.objects.all()))
+
+    def test_bulk_normalize_duplicates(self, mock_normalize):
+        Registration(section=self.section, email='a@b.com', phone='2155555555').save()
+        Registration(section=self.section, email='a@b.com', phone='2155555556').save()
+        Registration(section=self.section, email='a@b.com', phone='2155555557').save()
+        Registration.objects.filter(phone='+12155555556').update(phone='215-555-5555')
+        Registration.objects.filter(phone='+12155555557').update(phone='(215) 555-5555')
+        self.assertEqual(2, normalize_phones(Registration.objects.all()))
+        self.assertEqual(['+12155555555'], list(Registration.objects.values_list('phone', flat=True)))
+        self.section.refresh_from_db()
+        self.assertEqual(1, self.section.pending_registrations)
+
+
+class ArchiveSemesterTestCase(TestCase):
+    def setUp(self):
+        Option.objects.update_or_create(key='SEMESTER', value_type='TXT', defaults={'value': TEST_SEMESTER})
+        _, self.old_section = get_course_and_section('CIS-120-001', '2018A')
+        _, self.section = get_course_and_section('CIS-120-001', TEST_SEMESTER)
+        self.old_reg = Registration(email='e@example.com', section=self.old_section, notification_sent=True)
+        self.old_reg.save()
+        self.old_resub = Registration(email='e@example.com', section=self.old_section, resubscribed_from=self.old_reg)
+        self.old_resub.save()
+        Registration(email='e@example.com', section=self.section).save()
+        record_update('CIS-120-001', '2018A', 'C', 'O', True, '{"status": "O"}')
+        record_update('CIS-120-001', TEST_SEMESTER, 'C', 'O', True, '{"status": "O"}')
+
+    def test_archive(self):
+        result = archive.archive_semester('2018A', batch_size=1)
+        self.assertEqual({'course_updates': 1, 'registrations': 2, 'sections': 1}, result)
+
+        self.assertEqual(1, Registration.objects.count())
+        self.assertEqual(1, CourseUpdate.objects.count())
+        self.assertEqual(1, Section.objects.count())
+        self.assertFalse(Course.objects.filter(semester='2018A').exists())
+
+        update = ArchivedCourseUpdate.objects.get()
+        self.assertEqual('CIS-120-001', update.section_code)
+        self.assertEqual('{"status": "O"}', update.body)
+        resub = ArchivedRegistration.objects.get(original_id=self.old_resub.id)
+        self.assertEqual(self.old_reg.id, resub.resubscribed_from_id)
+        self.assertEqual('2018A', resub.semester)
+
+    def test_keep_catalog(self):
+        archive.archive_semester('2018A', keep_catalog=True)
+        self.assertEqual(2, Section.objects.count())
+
+    def test_current_semester(self):
+        with self.assertRaises(ValueError):
+            archive.archive_semester(TEST_SEMESTER)
+        self.assertEqual(0, ArchivedRegistration.objects.count())
+
+
+class RunCourseUpdatesTestCase(TestCase):
+    def setUp(self):
+        _, self.section = get_course_and_section('CIS-120-001', TEST_SEMESTER)
+        _, self.other = get_course_and_section('CIS-121-001', TEST_SEMESTER)
+        _, self.old = get_course_and_section('CIS-120-001', '2018A')
+        for s in [self.section, self.other, self.old]:
+            s.status = 'C'
+            s.save()
+
+    def status(self, section):
+        return Section.objects.get(id=section.id).status
+
+    def test_latest_update_wins(self):
+        record_update(self.section.normalized, TEST_SEMESTER, 'C', 'O', False, '')
+        record_update(self.section.normalized, TEST_SEMESTER, 'O', 'C', False, '')
+        record_update(self.section.normalized, TEST_SEMESTER, 'C', 'O', False, '')
+        record_update(self.other.normalized, TEST_SEMESTER, 'C', 'O', False, '')
+        record_update(self.other.normalized, TEST_SEMESTER, 'O', 'C', False, '')
+        result = tasks.run_course_updates(batch_size=1)
+        self.assertEqual(1, result['changed'])
+        self.assertEqual('O', self.status(self.section))
+        self.assertEqual('C', self.status(self.other))
+
+    def test_semester_filter(self):
+        record_update(self.section.normalized, TEST_SEMESTER, 'C', 'O', False, '')
+        record_update(self.old.normalized, '2018A', 'C', 'O', False, '')
+        result = tasks.run_course_updates(TEST_SEMESTER)
+        self.assertEqual(1, result['changed'])
+        self.assertEqual('O', self.status(self.section))
+        self.assertEqual('C', self.status(self.old))
+
+
+class TaskAuditTestCase(TestCase):
+    def test_alert_tasks_ignore_results(self):
+        for task in [tasks.send_alert, tasks.send_alerts_for, tasks.send_course_alerts, tasks.update_course_info]:
+            self.assertTrue(task.ignore_result, task.name)
+        self.assertFalse(tasks.load_courses.ignore_result)
+
+    @patch('pca.audit.logger')
+    def test_sampled(self, logger):
+        with self.settings(TASK_AUDIT_SAMPLE_RATE=1):
+            audit.audit_task('id', tasks.demo_task, (), {}, {'result': 'executed'}, 'SUCCESS')
+        with self.settings(TASK_AUDIT_SAMPLE_RATE=0):
+            audit.audit_task('id', tasks.demo_task, (), {}, {'result': 'executed'}, 'SUCCESS')
+        self.assertEqual(1, logger.info.call_count)
+
+
+@patch('pca.models.Text.send_alert')
+@patch('pca.models.Email.send_alert')
+class ClaimRegistrationsTestCase(TestCase):
+    def setUp(self):
+        _, self.section = get_course_and_section('CIS-120-001', TEST_SEMESTER)
+        self.regs = [Registration(email='%s@example.com' % name, section=self.section) for name in 'efg']
+        for reg in self.regs:
+            reg.save()
+        self.ids = [reg.id for reg in self.regs]
+
+    def test_claimed_once(self, mock_email, mock_text):
+        self.assertTrue(contains_all(self.ids, claim_registrations(self.ids, 'WEB')))
+        self.assertEqual([], claim_registrations(self.ids, 'SERV'))
+        for reg in Registration.objects.filter(id__in=self.ids):
+            self.assertTrue(reg.notification_sent)
+            self.assertEqual('WEB', reg.notification_sent_by)
+            self.assertIsNone(reg.dedup_key)
+        self.assertEqual(0, Section.objects.get(id=self.section.id).pending_registrations)
+
+    def test_claim_some(self, mock_email, mock_text):
+        self.regs[0].alert()
+        self.assertTrue(contains_all(self.ids[1:], claim_registrations(self.ids)))
+
+    @patch('pca.tasks.send_alert.delay')
+    def test_racing_section_alerts(self, mock_delay, mock_email, mock_text):
+        tasks.send_course_alerts(self.section.normalized, TEST_SEMESTER, sent_by='WEB')
+        tasks.send_course_alerts(self.section.normalized, TEST_SEMESTER, sent_by='SERV')
+        self.assertEqual(3, mock_delay.call_count)
+        self.assertTrue(contains_all(self.ids, [c[0][0] for c in mock_delay.call_args_list]))
+
+    def test_send_claimed(self, mock_email, mock_text):
+        claim_registrations(self.ids[:1])
+        tasks.send_alert(self.ids[0], claimed=True)
+        self.assertTrue(mock_email.called)
+        tasks.send_alert(self.ids[0])
+        self.assertEqual(1, mock_email.call_count)
+
+    @patch('pca.metrics.observe')
+    def test_end_to_end_includes_sending(self, mock_observe, mock_email, mock_text):
+        claim_registrations(self.ids[:1])
+        detected_at = time.time()
+        mock_email.side_effect = lambda: time.sleep(0.05) or True
+        tasks.send_alert(self.ids[0], detected_at=detected_at, claimed=True)
+        latencies = [c[0][1] for c in mock_observe.call_args_list if c[0][0] == 'end_to_end']
+        self.assertEqual(1, len(latencies))
+        self.assertGreaterEqual(latencies[0], 0.05)
+
+    def test_send_claimed_redelivered(self, mock_email, mock_text):
+        claim_registrations(self.ids[:1])
+        tasks.send_alert(self.ids[0], claimed=True)
+        tasks.send_alert(self.ids[0], claimed=True)
+        self.assertEqual(1, mock_email.call_count)
+
+    def test_release(self, mock_email, mock_text):
+        claim_registrations(self.ids, 'WEB')
+        self.assertTrue(contains_all(self.ids, release_registrations(self.ids)))
+        for reg in Registration.objects.filter(id__in=self.ids):
+            self.assertFalse(reg.notification_sent)
+            self.assertEqual('', reg.notification_sent_by)
+            self.assertIsNotNone(reg.dedup_key)
+        self.assertEqual(3, Section.objects.get(id=self.section.id).pending_registrations)
+        self.assertTrue(contains_all(self.ids, claim_registrations(self.ids)))
+
+    def test_release_signed_up_again(self, mock_email, mock_text):
+        claim_registrations(self.ids[:1])
+        Registration(email=self.regs[0].email, section=self.section).save()
+        self.assertEqual([], release_registrations(self.ids[:1]))
+        self.assertTrue(Registration.objects.get(id=self.ids[0]).notification_sent)
+
+    @patch('pca.tasks.send_alert.delay')
+    def test_release_when_queueing_fails(self, mock_delay, mock_email, mock_text):
+        mock_delay.side_effect = [None, OSError('broker down')]
+        with self.assertRaises(OSError):
+            tasks.send_course_alerts(self.section.normalized, TEST_SEMESTER)
+        self.assertEqual(1, Registration.objects.filter(id__in=self.ids, notification_sent=True).count())
+        self.assertEqual(2, Section.objects.get(id=self.section.id).pending_registrations)
+
+
+@override_settings(TWILIO_SID='ACtest', TWILIO_AUTH_TOKEN='token')
+class DeliveryEngineTestCase(TestCase):
+    def setUp(self):
+        self.messages = [delivery.Message(1, 'text', '+15555555555', None, 'open!'),
+                         delivery.Message(2, 'email', 'e@example.com', 'CIS-120-001 is now open!', 'open!')]
+
+    def send(self, smtp, twilio, messages=None, retries=2):
+        async def run():
+            await smtp.start()
+            await twilio.start()
+            try:
+                engine = delivery.DeliveryEngine(retries=retries, backoff=0, email_rate=0, text_rate=0,
+                                                 smtp_host='127.0.0.1', smtp_port=smtp.port, smtp_starttls=False,
+                                                 twilio_url=twilio.url)
+                return await engine.run(messages or self.messages)
+            finally:
+                await smtp.stop()
+                await twilio.stop()
+        self.results = asyncio.run(run())
+        return [error is None for _, error, _ in self.results]
+
+    def test_send(self):
+        smtp, twilio = fakes.FakeSMTPServer(), fakes.FakeTwilioServer()
+        self.assertEqual([True, True], self.send(smtp, twilio))
+        self.assertEqual('+15555555555', twilio.messages[0]['To'])
+        self.assertEqual(1, len(smtp.messages))
+
+    def test_many(self):
+        messages = [delivery.Message(i, 'text', '+1555555%04d' % i, None, 'open!') for i in range(50)]
+        twilio = fakes.FakeTwilioServer(latency=0.01)
+        self.assertTrue(all(self.send(fakes.FakeSMTPServer(), twilio, messages)))
+        self.assertEqual(50, len(twilio.messages))
+
+    def test_retry_throttled(self):
+        smtp, twilio = fakes.FakeSMTPServer(fail_first=2), fakes.FakeTwilioServer(fail_first=2)
+        self.assertEqual([True, True], self.send(smtp, twilio))
+
+    def test_give_up(self):
+        smtp, twilio = fakes.FakeSMTPServer(fail_first=5), fakes.FakeTwilioServer(fail_first=5)
+        self.assertEqual([False, False], self.send(smtp, twilio))
+
+    def test_permanent_failure_not_retried(self):
+        smtp = fakes.FakeSMTPServer(refuse=['e@example.com'])
+        twilio = fakes.FakeTwilioServer(invalid=['+15555555555'], fail_first=0)
+        self.assertEqual([False, False], self.send(smtp, twilio))
+        self.assertEqual(0, len(twilio.messages))
+        self.assertEqual([1, 1], [attempts for _, _, attempts in self.results])
+        self.assertFalse(any(error.transient for _, error, _ in self.results))
+
+
+@patch('pca.tasks.send_section_alerts.delay')
+@patch('pca.tasks.send_alert.delay')
+class DispatchAlertsTestCase(TestCase):
+    def test_async_delivery(self, mock_alert, mock_section):
+        Option.objects.update_or_create(key='ASYNC_DELIVERY', value_type='BOOL', defaults={'value': 'TRUE'})
+        tasks.dispatch_alerts([1, 2, 3])
+        self.assertEqual(1, mock_section.call_count)
+        self.assertEqual([1, 2, 3], mock_section.call_args[0][0])
+        self.assertFalse(mock_alert.called)
+
+    def test_task_per_alert(self, mock_alert, mock_section):
+        tasks.dispatch_alerts([1, 2, 3])
+        self.assertEqual(3, mock_alert.call_count)
+        self.assertFalse(mock_section.called)
+
+
+@patch('pca.models.current_app.send_task')
+@patch('pca.models.Text.send_alert')
+@patch('pca.models.Email.send_alert')
+class DeliveryTrackingTestCase(TestCase):
+    def setUp(self):
+        _, self.section = get_course_and_section('CIS-120-001', TEST_SEMESTER)
+        self.reg = Registration(email='e@example.com', phone='+15555555555', section=self.section)
+        self.reg.save()
+
+    def delivery(self, channel):
+        return Delivery.objects.get(registration=self.reg, channel=channel)
+
+    def test_sent(self, mock_email, mock_text, mock_send_task):
+        self.assertTrue(self.reg.alert())
+        self.assertEqual(Delivery.SENT, self.delivery(Delivery.EMAIL).status)
+        self.assertEqual(Delivery.SENT, self.delivery(Delivery.TEXT).status)
+        self.assertFalse(mock_send_task.called)
+
+    def test_created_by_this_call(self, mock_email, mock_text, mock_send_task):
+        Delivery(registration=self.reg, channel=Delivery.EMAIL).save()
+        deliveries = create_deliveries([self.reg])
+        self.assertEqual(2, len(deliveries))
+        self.assertEqual(3, Delivery.objects.filter(registration=self.reg).count())
+
+    def test_throttled_retried(self, mock_email, mock_text, mock_send_task):
+        mock_text.side_effect = DeliveryError('Twilio 429', transient=True)
+        self.assertFalse(self.reg.alert())
+        text = self.delivery(Delivery.TEXT)
+        self.assertEqual(Delivery.RETRYING, text.status)
+        self.assertEqual(1, text.attempts)
+        self.assertEqual('Twilio 429', text.last_error)
+        self.assertEqual(Delivery.SENT, self.delivery(Delivery.EMAIL).status)
+        mock_send_task.assert_called_once_with('pca.tasks.retry_deliveries', ([text.id], ),
+                                               countdown=retry_backoff(1))
+
+        mock_text.side_effect = None
+        tasks.retry_deliveries([text.id])
+        text = self.delivery(Delivery.TEXT)
+        self.assertEqual(Delivery.SENT, text.status)
+        self.assertEqual(2, text.attempts)
+
+    def test_permanent_failure(self, mock_email, mock_text, mock_send_task):
+        mock_email.side_effect = DeliveryError('recipient refused')
+        self.reg.alert()
+        self.assertEqual(Delivery.FAILED, self.delivery(Delivery.EMAIL).status)
+        self.assertFalse(mock_send_task.called)
+
+    def test_give_up(self, mock_email, mock_text, mock_send_task):
+        mock_text.side_effect = DeliveryError('Twilio 503', transient=True)
+        self.reg.alert()
+        text = self.delivery(Delivery.TEXT)
+        with self.settings(DELIVERY_MAX_ATTEMPTS=2):
+            tasks.retry_deliveries([text.id])
+        text = self.delivery(Delivery.TEXT)
+        self.assertEqual(Delivery.FAILED, text.status)
+        self.assertEqual(2, text.attempts)
+        self.assertEqual(1, mock_send_task.call_count)
+
+
+class ConnectionChecksTestCase(TestCase):
+    def test_unusable_closed(self):
+        conn = Mock(connection=object())
+        conn.is_usable.return_value = False
+        with patch('pca.db.connections') as connections, patch('pca.db.close_old_connections'):
+            connections.all.return_value = [conn]
+            db.check_connections()
+            self.assertTrue(conn.close.called)
+            conn.reset_mock()
+            conn.is_usable.return_value = True
+            db.check_connections()
+            self.assertFalse(conn.close.called)
+
+    def test_inherited_connections_not_closed(self):
+        conn = Mock(connection=object())
+        with patch('pca.db.connections') as connections:
+            connections.all.return_value = [conn]
+            db.discard_inherited_connections()
+        self.assertIsNone(conn.connection)
+        self.assertFalse(conn.close.called)
+
+
+class ReplicaRouterTestCase(TestCase):
+    def setUp(self):
+        self.router = db.ReplicaRouter()
+
+    def read(self):
+        return self.router.db_for_read(Registration)
+
+    def with_replica(self):
+        return self.settings(DATABASES=dict(settings.DATABASES, replica=settings.DATABASES['default']))
+
+    def test_no_replica(self):
+        with db.replica():
+            self.assertEqual('default', self.read())
+
+    def test_replica_block(self):
+        with self.with_replica():
+            self.assertEqual('default', self.read())
+            with db.replica():
+                self.assertEqual('replica', self.read())
+                with db.primary():
+                    self.assertEqual('default', self.read())
+                self.assertEqual('replica', self.read())
+
+    def test_read_your_writes(self):
+        with self.with_replica():
+            with db.replica():
+                self.assertEqual('default', self.router.db_for_write(Registration))
+                self.assertEqual('default', self.read())
+            with db.replica():
+                self.assertEqual('replica', self.read())
+
+    def test_registration_pins_client(self):
+        _, section = get_course_and_section('CIS-120-001', TEST_SEMESTER)
+        response = Client().post(reverse('register'), {'course': section.normalized, 'email': 'e@example.com'})
+        self.assertIn(db.PIN_COOKIE, response.cookies)
+
+
+class RegistrationSearchTestCase(TestCase):
+    def setUp(self):
+        _, self.cis120 = get_course_and_section('CIS-120-001', TEST_SEMESTER)
+        _, self.cis120_old = get_course_and_section('CIS-120-001', '2018C')
+        _, self.cis121 = get_course_and_section('CIS-121-001', TEST_SEMESTER)
+        self.r1 = Registration(email='alice@example.com', section=self.cis120)
+        self.r2 = Registration(email='bob@example.com', section=self.cis120_old)
+        self.r3 = Registration(phone='2155551234', section=self.cis121)
+        for reg in [self.r1, self.r2, self.r3]:
+            reg.save()
+        self.admin = RegistrationAdmin(Registration, admin.site)
+
+    def search(self, term):
+        results, _ = self.admin.get_search_results(None, Registration.objects.all(), term)
+        return sorted(reg.id for reg in results)
+
+    def test_search_key_saved(self):
+        reg = Registration.objects.get(id=self.r1.id)
+        self.assertEqual(('CIS-120-001', TEST_SEMESTER), (reg.section_code, reg.semester))
+        reg.section = self.cis121
+        reg.save()
+        self.assertEqual('CIS-121-001', Registration.objects.get(id=self.r1.id).section_code)
+
+    def test_search_key_without_query(self):
+        Option.objects.update_or_create(key='SEMESTER', value_type='TXT', defaults={'value': TEST_SEMESTER})
+        with self.assertNumQueries(0):
+            self.assertEqual(('CIS-120-001', TEST_SEMESTER), Registration(section=self.cis120).search_keys())
+        with self.assertNumQueries(1):
+            self.assertEqual(('CIS-120-001', TEST_SEMESTER), Registration(section_id=self.cis120.id).search_keys())
+        with patch('pca.models.section_search_keys') as mock_keys:
+            register_for_course('CIS-121-001', 'carol@example.com', None)
+        self.assertFalse(mock_keys.called)
+        reg = Registration.objects.get(email='carol@example.com')
+        self.assertEqual(('CIS-121-001', TEST_SEMESTER), (reg.section_code, reg.semester))
+
+    def test_bulk_search_key(self):
+        register_for_sections(['CIS-121-001'], 'carol@example.com', None)
+        reg = Registration.objects.get(email='carol@example.com')
+        self.assertEqual(('CIS-121-001', TEST_SEMESTER), (reg.section_code, reg.semester))
+
+    def test_section(self):
+        self.assertEqual(sorted([self.r1.id, self.r2.id]), self.search('CIS-120-001'))
+        self.assertEqual(sorted([self.r1.id, self.r2.id]), self.search('cis120001'))
+        self.assertEqual([self.r1.id], self.search('CIS-120-001 2019a'))
+
+    def test_course(self):
+        self.assertEqual(sorted([self.r1.id, self.r2.id]), self.search('CIS 120'))
+        self.assertEqual([self.r3.id], self.search('CIS-121'))
+
+    def test_contact(self):
+        self.assertEqual([self.r1.id], self.search('alice'))
+        self.assertEqual([self.r3.id], self.search('(215) 555'))
+        self.assertEqual([], self.search('carol'))
+
+
+class EstimatedCountPaginatorTestCase(TestCase):
+    def setUp(self):
+        _, section = get_course_and_section('CIS-120-001', TEST_SEMESTER)
+        for i in range(25):
+            CourseUpdate(section=section, old_status='C', new_status='O', alert_sent=False, request_body='').save()
+        self.updates = CourseUpdate.objects.order_by('-id')
+        for key in pagination.r.scan_iter('pca:admin:seek:*'):
+            pagination.r.delete(key)
+
+    @patch('pca.pagination.estimated_count')
+    def test_estimated_count(self, mock_estimate):
+        mock_estimate.return_value = 20000
+        with self.settings(ADMIN_ESTIMATED_COUNT_MIN=10000):
+            self.assertEqual(20000, pagination.EstimatedCountPaginator(self.updates, 10).count)
+            filtered = self.updates.filter(alert_sent=False)
+            self.assertEqual(25, pagination.EstimatedCountPaginator(filtered, 10).count)
+        mock_estimate.return_value = 100
+        with self.settings(ADMIN_ESTIMATED_COUNT_MIN=10000):
+            self.assertEqual(25, pagination.EstimatedCountPaginator(self.updates, 10).count)
+
+    def test_seek_matches_offset(self):
+        for updates in [self.updates, CourseUpdate.objects.order_by('id')]:
+            expected = [[u.id for u in Paginator(updates, 10).page(n)] for n in (1, 2, 3)]
+            with self.settings(ADMIN_SEEK_OFFSET=0):
+                paginator = pagination.EstimatedCountPaginator(updates, 10)
+                self.assertEqual(expected, [[u.id for u in paginator.page(n)] for n in (1, 2, 3)])
+
+    def test_seek_from_previous_page(self):
+        expected = [u.id for u in Paginator(self.updates, 10).page(3)]
+        with self.settings(ADMIN_SEEK_OFFSET=0):
+            paginator = pagination.EstimatedCountPaginator(self.updates, 10)
+            list(paginator.page(2))
+            with patch('django.db.models.query.QuerySet.values_list') as mock_values_list:
+                self.assertEqual(expected, [u.id for u in paginator.page(3)])
+            self.assertFalse(mock_values_list.called)
+
+    def test_no_seek_without_pk_ordering(self):
+        paginator = pagination.EstimatedCountPaginator(CourseUpdate.objects.order_by('created_at'), 10)
+        self.assertIsNone(paginator.pk_ordering())
+        self.assertEqual('desc', pagination.EstimatedCountPaginator(self.updates, 10).pk_ordering())
+
+
+@patch('pca.jobs.start', return_value='job')
+class BulkAdminActionsTestCase(TestCase):
+    def setUp(self):
+        _, self.cis120 = get_course_and_section('CIS-120-001', TEST_SEMESTER)
+        _, self.cis121 = get_course_and_section('CIS-121-001', TEST_SEMESTER)
+        self.r1 = Registration.objects.create(email='a@example.com', section=self.cis120)
+        self.r2 = Registration.objects.create(email='b@example.com', section=self.cis120)
+        self.r3 = Registration.objects.create(email='c@example.com', section=self.cis121)
+        self.sent = Registration.objects.create(email='d@example.com', section=self.cis121, notification_sent=True)
+        self.registration_admin = RegistrationAdmin(Registration, admin.site)
+        self.section_admin = SectionAdmin(Section, admin.site)
+        self.registration_admin.message_user = Mock()
+        self.section_admin.message_user = Mock()
+
+    def batches(self, mock_delay):
+        return sorted(sorted(call[0][0]) for call in mock_delay.call_args_list)
+
+    @patch('pca.tasks.send_section_alerts.delay')
+    def test_send_alerts_per_section(self, mock_delay, mock_start):
+        self.registration_admin.send_alerts(None, Registration.objects.all())
+        self.assertEqual([sorted([self.r1.id, self.r2.id]), [self.r3.id]], self.batches(mock_delay))
+        mock_start.assert_called_once_with('Send alerts', 3)
+        self.assertEqual(3, Registration.objects.filter(notification_sent_by='ADM').count())
+
+    @patch('pca.tasks.send_section_alerts.delay')
+    def test_section_send_alerts(self, mock_delay, mock_start):
+        self.section_admin.send_alerts(None, Section.objects.filter(id=self.cis121.id))
+        self.assertEqual([[self.r3.id]], self.batches(mock_delay))
+        self.assertFalse(Registration.objects.get(id=self.r1.id).notification_sent)
+
+    def test_actions_listed(self, mock_start):
+        request = Mock(GET={})
+        request.user.has_perm.return_value = True
+        for model_admin in (self.registration_admin, self.section_admin):
+            actions = model_admin.get_actions(request)
+            self.assertIn('send_alerts', actions)
+            self.assertIn('resubscribe', actions)
+
+    @patch('pca.tasks.send_section_alerts.delay')
+    def test_send_alerts_queueing_fails(self, mock_delay, mock_start):
+        mock_delay.side_effect = [None, OSError('broker down')]
+        with self.assertRaises(OSError):
+            self.registration_admin.send_alerts(None, Registration.objects.all())
+        queued = mock_delay.call_args_list[0][0][0]
+        self.assertEqual(len(queued), Registration.objects.filter(notification_sent_by='ADM').count())
+        self.assertEqual(3 - len(queued), Registration.objects.filter(notification_sent=False).count())
+
+    @patch('pca.tasks.send_section_alerts.delay')
+    def test_send_alerts_untracked(self, mock_delay, mock_start):
+        mock_start.return_value = None  # redis is down
+        self.registration_admin.send_alerts(None, Registration.objects.all())
+        self.assertEqual(2, mock_delay.call_count)
+        self.assertIsNone(mock_delay.call_args[1]['job_id'])
+
+    @patch('pca.tasks.resubscribe_registrations.delay')
+    def test_section_resubscribe(self, mock_delay, mock_start):
+        resubscribed = self.sent.resubscribe()
+        resubscribed.notification_sent = True
+        resubscribed.save()
+        self.section_admin.resubscribe(None, Section.objects.all())
+        self.assertEqual([[resubscribed.id]], self.batches(mock_delay))
+
+    @patch('pca.tasks.reload_sections.delay')
+    def test_reload_from_registrar(self, mock_delay, mock_start):
+        _, cis120_002 = get_course_and_section('CIS-120-002', TEST_SEMESTER)
+        self.section_admin.reload_from_registrar(None, Section.objects.all())
+        courses = sorted((course, semester, sorted(codes)) for course, semester, codes in mock_delay.call_args[0][0])
+        self.assertEqual([('CIS-120', TEST_SEMESTER, ['001', '002']), ('CIS-121', TEST_SEMESTER, ['001'])], courses)
+        mock_start.assert_called_once_with('Reload from registrar', 3)
+
+    @patch('pca.jobs.progress')
+    @patch('pca.api.get_courses')
+    def test_reload_sections(self, mock_get, mock_progress, mock_start):
+        with open('pca/mock_registrar_response.json', 'r') as f:
+            response = json.load(f)
+        mock_get.return_value = [response]
+        tasks.reload_sections([('CIS-160', '2019A', ['001', '002'])], job_id='job')
+        mock_get.assert_called_once_with('CIS-160', '2019A')
+        _, section = get_course_and_section('CIS-160-001', '2019A')
+        self.assertEqual(response['course_status'], section.status)
+        mock_progress.assert_called_once_with('job', done=2, failed=1)
+
+
+@patch('pca.jobs.r.pipeline')
+class AdminJobsTestCase(TestCase):
+    def test_redis_down(self, mock_pipeline):
+        mock_pipeline.return_value.execute.side_effect = redis.ConnectionError
+        self.assertIsNone(jobs.start('Send alerts', 3))
+        jobs.progress('job', done=1)
+        self.assertEqual([], jobs.recent())
@@ -4,7 +4,10 @@ from . import views
 urlpatterns = [
     path('', views.index, name='index'),
     path('courses', views.get_sections, name='courses'),
+    path('courses/search', views.search_sections, name='courses-search'),
     path('submitted', views.register, name='register'),
+    path('api/register', views.register_bulk, name='register-bulk'),
     path('resubscribe/<int:id_>', views.resubscribe, name='resubscribe'),
     path('webhook', views.accept_webhook, name='webhook'),
+    path('metrics/latency', views.alert_latency, name='alert-latency'),
 ]
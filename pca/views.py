@@ -1,14 +1,19 @@
 import re
+import time
 import base64
 import logging
 
-from django.shortcuts import render
+from django.shortcuts import render, get_object_or_404
 from django.http import HttpResponseRedirect, JsonResponse, Http404, HttpResponse
 from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from django.utils.cache import patch_vary_headers
+from django.contrib.admin.views.decorators import staff_member_required
 
 from .models import *
-from .tasks import generate_course_json, send_course_alerts
+from .tasks import generate_course_json, generate_compact_course_json, send_course_alerts, buffer_registration
+from . import metrics, search, catalog, db
 from options.models import get_bool
 
 
@@ -41,6 +46,7 @@ def index(request):
     return render_homepage(request, [])
 
 
+@db.pins_primary
 def register(request):
     if not get_bool('REGISTRATION_OPEN', True):
         return HttpResponseRedirect(reverse('index'))
@@ -50,7 +56,10 @@ def register(request):
         email_address = request.POST.get('email', None)
         phone = request.POST.get('phone', None)
 
-        res = register_for_course(course_code, email_address, phone)
+        if get_bool('REGISTRATION_BUFFERING', False):
+            res = buffer_registration(course_code, email_address, phone)
+        else:
+            res = register_for_course(course_code, email_address, phone)
 
         if res == RegStatus.SUCCESS:
             return homepage_with_msg(request,
@@ -64,6 +73,10 @@ def register(request):
             return homepage_with_msg(request,
                                      'danger',
                                      'Please enter either a phone number or an email address.')
+        elif res == RegStatus.COURSE_NOT_FOUND:
+            return homepage_with_msg(request,
+                                     'danger',
+                                     "We couldn't find %s. Please pick a section from the list!" % course_code)
         else:
             return homepage_with_msg(request,
                                      'warning',
@@ -72,24 +85,90 @@ def register(request):
         raise Http404('GET not accepted')
 
 
+@db.pins_primary
+@require_POST
+def register_bulk(request):
+    """
+    Register one contact for alerts on many sections. Expects a JSON body like
+    `{"sections": ["CIS-120-001", ...], "email": "...", "phone": "..."}`
+    and responds with the RegStatus of each section.
+    """
+    if not get_bool('REGISTRATION_OPEN', True):
+        return JsonResponse({'message': 'registration is closed'}, status=403)
+
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'message': 'error decoding JSON body'}, status=400)
+
+    if not isinstance(data, dict):
+        return JsonResponse({'message': 'expected a JSON object'}, status=400)
+    sections = data.get('sections', None)
+    if not isinstance(sections, list) or len(sections) == 0 or not all(isinstance(s, str) for s in sections):
+        return JsonResponse({'message': 'expected a list of sections'}, status=400)
+    if len(sections) > settings.BULK_REGISTRATION_MAX:
+        return JsonResponse({'message': 'at most %d sections at once' % settings.BULK_REGISTRATION_MAX}, status=400)
+
+    results = register_for_sections(sections, data.get('email', None), data.get('phone', None))
+    return JsonResponse({'results': {course_code: status.name for course_code, status in results.items()}})
+
+
+@db.pins_primary
 def resubscribe(request, id_):
-    if not Registration.objects.filter(id=id_).exists():
-        raise Http404('No registration found')
+    old_reg = get_object_or_404(Registration, id=id_)
+    new_reg = old_reg.resubscribe()
+    return homepage_with_msg(request,
+                             'info',
+                             'You have been resubscribed for alerts to %s!' % new_reg.section.normalized)
+
+
+def wants_compact(request):
+    """Clients ask for the compact catalog format with `?format=compact` or its content type in `Accept`."""
+    return request.GET.get('format') == 'compact' or \
+        catalog.COMPACT_CONTENT_TYPE in request.META.get('HTTP_ACCEPT', '')
+
+
+def catalog_response(request, sections, compact):
+    """
+    The catalog in whichever format the client asked for. It depends on `Accept`, so shared caches
+    mustn't serve one client's format to another.
+    """
+    if wants_compact(request):
+        response = JsonResponse(compact(), content_type=catalog.COMPACT_CONTENT_TYPE)
     else:
-        old_reg = Registration.objects.get(id=id_)
-        new_reg = old_reg.resubscribe()
-        return homepage_with_msg(request,
-                                 'info',
-                                 'You have been resubscribed for alerts to %s!' % new_reg.section.normalized)
+        response = JsonResponse(sections(), safe=False)
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+
+def sections_response(request, sections):
+    return catalog_response(request, lambda: sections, lambda: catalog.compact(sections))
 
 
 def get_sections(request):
-    sections = generate_course_json()
-    return JsonResponse(sections, safe=False)
+    return catalog_response(request, generate_course_json, generate_compact_course_json)
+
+
+def search_sections(request):
+    """Sections matching the typeahead query `q`, served from an in-memory prefix index of the catalog."""
+    query = request.GET.get('q', '')
+    try:
+        limit = min(int(request.GET.get('limit', settings.SEARCH_RESULTS_MAX)), settings.SEARCH_RESULTS_MAX)
+    except ValueError:
+        return HttpResponse('limit must be a number', status=400)
+    if limit < 1:
+        return HttpResponse('limit must be positive', status=400)
+    return sections_response(request, search.get_index(generate_course_json).search(query, limit))
+
+
+@staff_member_required
+def alert_latency(request):
+    """Alert latency histograms and percentiles per stage, in seconds."""
+    return JsonResponse(metrics.summary())
 
 
-def alert_for_course(c_id, semester, sent_by):
-    send_course_alerts.delay(c_id, semester=semester, sent_by=sent_by)
+def alert_for_course(c_id, semester, sent_by, detected_at=None):
+    send_course_alerts.delay(c_id, semester=semester, sent_by=sent_by, detected_at=detected_at)
 
 
 def extract_basic_auth(auth_header):
@@ -123,6 +202,7 @@ def handle_course_update(update):
 
 @csrf_exempt
 def accept_webhook(request):
+    received_at = time.time()
     auth_header = request.META.get('Authorization', request.META.get('HTTP_AUTHORIZATION', ''))
 
     username, password = extract_basic_auth(auth_header)
@@ -174,7 +254,7 @@ def accept_webhook(request):
 
     if should_send_alert:
         try:
-            alert_for_course(course_id, semester=course_term, sent_by='WEB')
+            alert_for_course(course_id, semester=course_term, sent_by='WEB', detected_at=received_at)
             return JsonResponse({'message': 'webhook recieved, alerts sent'})
         except ValueError:
             return JsonResponse({'message': 'course code could not be parsed'})